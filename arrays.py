@@ -0,0 +1,93 @@
+from datetime import timezone
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+DEFAULT_CAPACITY = 1024
+INT_TYPES = ("int", "integer", "int4", "bigint", "int8", "smallint", "int2")
+FLOAT_TYPES = ("float", "double precision", "float8", "real", "float4")
+
+
+def column_dtype(column_type: str) -> np.dtype:
+    if column_type.startswith("timestamp"):
+        return np.dtype("datetime64[us]")
+    if column_type == "date":
+        return np.dtype("datetime64[D]")
+    if column_type in INT_TYPES:
+        return np.dtype(np.int64)
+    if column_type in FLOAT_TYPES:
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def with_time_zone(column_type: str) -> bool:
+    return column_type.startswith("timestamptz") or "with time zone" in column_type
+
+
+def naive_utc(value):
+    # datetime64 has no time zone, numpy warns about aware values and drops the offset unconverted
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ColumnArrays:
+    # Column buffers grow geometrically and are filled batch by batch, rows never exist as tuples
+    # longer than one cursor batch
+    def __init__(self, columns: List[str], types: List[str], capacity: int = DEFAULT_CAPACITY):
+        if len(columns) != len(types):
+            raise Exception("Types count must coincide with Table Columns count")
+        self.columns = columns
+        self.capacity = max(1, capacity)
+        self.rows_count = 0
+        self.arrays = [np.empty(self.capacity, dtype=column_dtype(column_type)) for column_type in types]
+        self.aware = [with_time_zone(column_type) for column_type in types]
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for array in self.arrays:
+            array.resize(capacity, refcheck=False)
+        self.capacity = capacity
+
+    def extend(self, rows: list):
+        if not rows:
+            return
+        start = self.rows_count
+        end = start + len(rows)
+        if end > self.capacity:
+            self._grow(end)
+        for i, values in enumerate(zip(*rows)):
+            array = self.arrays[i]
+            if self.aware[i]:
+                values = [naive_utc(value) for value in values]
+            try:
+                array[start:end] = values
+            except TypeError:
+                if array.dtype != np.int64:
+                    raise
+                # NULL in an integer column: NaN needs a float column
+                array = self.arrays[i] = array.astype(np.float64)
+                array[start:end] = [np.nan if value is None else value for value in values]
+        self.rows_count = end
+
+    def result(self, fixed_width_text: bool = False) -> Dict[str, np.ndarray]:
+        arrays = {}
+        for name, array in zip(self.columns, self.arrays):
+            array.resize(self.rows_count, refcheck=False)
+            if fixed_width_text and array.dtype == object:
+                array = np.array(["" if value is None else value for value in array], dtype=np.str_)
+            arrays[name] = array
+        return arrays
+
+
+def fetch_arrays(batches: Iterable[list], columns: List[str], types: List[str],
+                 capacity: int = DEFAULT_CAPACITY,
+                 fixed_width_text: bool = False) -> Dict[str, np.ndarray]:
+    # int -> int64 (float64 with NaN once a NULL shows up), float -> float64,
+    # timestamp -> datetime64[us] with NaT for NULL (timestamptz in UTC), anything else -> object or fixed-width str
+    buffers = ColumnArrays(columns, types, capacity)
+    for rows in batches:
+        buffers.extend(rows)
+    return buffers.result(fixed_width_text)
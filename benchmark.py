@@ -0,0 +1,296 @@
+import argparse
+import csv
+import json
+import math
+from datetime import datetime
+from statistics import mean, stdev
+from time import perf_counter_ns
+from typing import Callable, Dict, List
+
+import numpy as np
+from psycopg2 import sql
+
+from metrics import REGISTRY
+from postgres.copy_loader import CopyLoader
+
+WORKLOADS = (
+    "full_scan",
+    "limit_sweep",
+    "point_lookup",
+    "bulk_insert",
+)
+DEFAULT_WARMUPS = 2
+DEFAULT_REPETITIONS = 10
+DEFAULT_BATCH_SIZES = [1_000, 10_000, 50_000]
+SERVER_SETTINGS = (
+    "server_version",
+    "shared_buffers",
+    "work_mem",
+    "effective_cache_size",
+    "max_parallel_workers_per_gather",
+    "jit",
+)
+CSV_FIELDS = [
+    "workload", "parameter", "repetitions",
+    "min_ms", "mean_ms", "stdev_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+]
+
+
+def percentile(samples: List[int], q: float) -> float:
+    # Linear interpolation between closest ranks, same as numpy's default
+    ordered = sorted(samples)
+    if not ordered:
+        return math.nan
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class BenchmarkResult:
+    def __init__(self, workload: str, parameter, samples_ns: List[int]):
+        self.workload = workload
+        self.parameter = parameter
+        self.samples_ns = samples_ns
+
+    def stats_ms(self) -> Dict[str, float]:
+        samples = self.samples_ns
+        return {
+            "min_ms": min(samples) / 1e6,
+            "mean_ms": mean(samples) / 1e6,
+            "stdev_ms": (stdev(samples) if len(samples) > 1 else 0.0) / 1e6,
+            "p50_ms": percentile(samples, 50) / 1e6,
+            "p95_ms": percentile(samples, 95) / 1e6,
+            "p99_ms": percentile(samples, 99) / 1e6,
+            "max_ms": max(samples) / 1e6,
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "workload": self.workload,
+            "parameter": self.parameter,
+            "repetitions": len(self.samples_ns),
+            **self.stats_ms(),
+            "samples_ns": self.samples_ns,
+        }
+
+
+class Benchmark:
+    def __init__(self, database, table_name: str,
+                 warmups: int = DEFAULT_WARMUPS,
+                 repetitions: int = DEFAULT_REPETITIONS):
+        if repetitions < 1:
+            raise Exception("At least one repetition is required")
+        self.database = database
+        self.table = database.get_table(table_name)
+        self.warmups = warmups
+        self.repetitions = repetitions
+
+    def measure(self, workload: str, parameter, run: Callable, setup: Callable = None) -> BenchmarkResult:
+        # Warmups bring the plan cache and shared buffers to a steady state before sampling
+        samples = []
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                for i in range(self.warmups + self.repetitions):
+                    if setup:
+                        setup(cursor)
+                    start_time = perf_counter_ns()
+                    run(cursor)
+                    elapsed = perf_counter_ns() - start_time
+                    if i >= self.warmups:
+                        samples.append(elapsed)
+        return BenchmarkResult(workload, parameter, samples)
+
+    def table_query(self, query: str) -> sql.Composed:
+        return sql.SQL(query).format(table=sql.Identifier(self.table.name))
+
+    def full_scan(self) -> List[BenchmarkResult]:
+        query = self.table_query("SELECT * FROM {table}")
+
+        def run(cursor):
+            cursor.execute(query)
+            cursor.fetchall()
+
+        return [self.measure("full_scan", None, run)]
+
+    def limit_sweep(self, limits: List[int]) -> List[BenchmarkResult]:
+        query = self.table_query("SELECT * FROM {table} LIMIT %s")
+        results = []
+        for limit in limits:
+            def run(cursor, limit=limit):
+                self.table.execute_prepared(cursor, "limit", query, [limit])
+                cursor.fetchall()
+
+            results.append(self.measure("limit_sweep", limit, run))
+        return results
+
+    def point_lookup(self, lookups: int = 100) -> List[BenchmarkResult]:
+        key = self.table.get_key_column()
+        if key is None:
+            raise Exception(f"Table {self.table.name} has no single-column primary key")
+        key_sql = {"table": sql.Identifier(self.table.name), "key": sql.Identifier(key)}
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("SELECT {key} FROM {table} ORDER BY random() LIMIT %s").format(**key_sql),
+                               (lookups,))
+                keys = [item[0] for item in cursor.fetchall()]
+        query = sql.SQL("SELECT * FROM {table} WHERE {key} = %s").format(**key_sql)
+
+        def run(cursor):
+            for value in keys:
+                cursor.execute(query, (value,))
+                cursor.fetchall()
+
+        return [self.measure("point_lookup", len(keys), run)]
+
+    def bulk_insert(self, batch_sizes: List[int]) -> List[BenchmarkResult]:
+        # Rows are copied into a temporary clone of the table that is emptied before each run
+        staging = "benchmark_{}".format(self.table.name)
+        loader = CopyLoader(staging, self.table.columns, self.table.columns_types)
+        select_query = self.table_query("SELECT * FROM {table} LIMIT %s")
+        truncate_query = sql.SQL("TRUNCATE {}").format(sql.Identifier(staging))
+        results = []
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {}) ON COMMIT DROP").format(
+                    sql.Identifier(staging), sql.Identifier(self.table.name)
+                ))
+            for batch_size in batch_sizes:
+                with conn.cursor() as cursor:
+                    cursor.execute(select_query, (batch_size,))
+                    rows = cursor.fetchall()
+
+                def run(cursor, rows=rows):
+                    loader.copy_batch(cursor, rows)
+
+                results.append(self.measure("bulk_insert", len(rows), run,
+                                            setup=lambda cursor: cursor.execute(truncate_query)))
+        return results
+
+    def server_settings(self) -> Dict[str, str]:
+        settings = {}
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                for name in SERVER_SETTINGS:
+                    cursor.execute("SELECT current_setting(%s)", (name,))
+                    settings[name] = cursor.fetchone()[0]
+        return settings
+
+    def run(self, workloads: List[str],
+            limits: List[int] = None,
+            batch_sizes: List[int] = None,
+            lookups: int = 100) -> List[BenchmarkResult]:
+        results = []
+        for workload in workloads:
+            match workload:
+                case "full_scan":
+                    results.extend(self.full_scan())
+                case "limit_sweep":
+                    results.extend(self.limit_sweep(limits or self.default_limits()))
+                case "point_lookup":
+                    results.extend(self.point_lookup(lookups))
+                case "bulk_insert":
+                    results.extend(self.bulk_insert(batch_sizes or DEFAULT_BATCH_SIZES))
+                case _:
+                    raise Exception(f"Unknown workload: {workload}")
+        return results
+
+    def default_limits(self, points: int = 10) -> List[int]:
+        step = max(1, self.table.get_rows_count(exact=False) // points)
+        return [i * step for i in range(1, points + 1)]
+
+    def report(self, results: List[BenchmarkResult]) -> dict:
+        return {
+            "table": self.table.name,
+            "database": self.database.db_name,
+            "created_at": datetime.now().isoformat(),
+            "warmups": self.warmups,
+            "repetitions": self.repetitions,
+            "server": self.server_settings(),
+            "results": [result.to_dict() for result in results],
+        }
+
+
+def save_json(report: dict, file_name: str):
+    with open(file_name, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def save_csv(results: List[BenchmarkResult], file_name: str):
+    with open(file_name, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result.to_dict())
+
+
+def plot_results(results: List[BenchmarkResult], workload: str, title: str):
+    from utils import build_chart
+
+    points = [result for result in results if result.workload == workload]
+    if not points:
+        return
+    stats = [result.stats_ms() for result in points]
+    p50 = np.fromiter((item["p50_ms"] for item in stats), dtype=np.float64, count=len(stats))
+    # Bars span from the fastest run to p95 around the median
+    errors = np.array([
+        [item["p50_ms"] - item["min_ms"] for item in stats],
+        [item["p95_ms"] - item["p50_ms"] for item in stats],
+    ])
+    parameters = np.fromiter((result.parameter for result in points), dtype=np.int64, count=len(points))
+    build_chart(parameters, p50, "Rows count", "Query Time, ms (p50, min..p95)", title, errors)
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="PostgreSQL table latency benchmark")
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--workload", action="append", choices=WORKLOADS,
+                        help="may be repeated, defaults to limit_sweep")
+    parser.add_argument("--warmups", type=int, default=DEFAULT_WARMUPS)
+    parser.add_argument("--repetitions", type=int, default=DEFAULT_REPETITIONS)
+    parser.add_argument("--limits", type=int, nargs="+")
+    parser.add_argument("--batch-sizes", type=int, nargs="+")
+    parser.add_argument("--lookups", type=int, default=100)
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--csv", help="write summary statistics to this file")
+    parser.add_argument("--plot", choices=("limit_sweep", "bulk_insert"))
+    parser.add_argument("--metrics", help="write the instrumentation registry to this file (.prom for Prometheus text)")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    from main import Database, User
+
+    args = parse_args(argv)
+    database = Database(User(args.user, args.password), args.database, host=args.host, port=args.port)
+    if not database.pool:
+        raise SystemExit("Invalid connection")
+    try:
+        benchmark = Benchmark(database, args.table, args.warmups, args.repetitions)
+        results = benchmark.run(args.workload or ["limit_sweep"], args.limits, args.batch_sizes, args.lookups)
+        report = benchmark.report(results)
+    finally:
+        database.close()
+
+    for result in results:
+        stats = result.stats_ms()
+        print("{:<13} {:>10} p50={:.3f}ms p95={:.3f}ms p99={:.3f}ms".format(
+            result.workload, str(result.parameter), stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]
+        ))
+    if args.json:
+        save_json(report, args.json)
+    if args.csv:
+        save_csv(results, args.csv)
+    if args.metrics:
+        REGISTRY.save(args.metrics)
+    if args.plot:
+        plot_results(results, args.plot, args.table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+from typing import Iterator, List, Literal, Optional
+
+from importer import ImportPipeline
+from metrics import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNAR_FORMATS = Literal[
+    "parquet",
+    "arrow",
+]
+FILE_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+}
+DEFAULT_BATCH_ROWS = 65_536
+TEXT_TYPES = ("text", "character varying", "varchar", "character", "char", "bpchar")
+
+
+def require_pyarrow():
+    if pa is None:
+        raise Exception("Parquet and Arrow files require the 'pyarrow' package")
+
+
+def detect_columnar_format(file_name: str) -> Optional[str]:
+    name = file_name.lower()
+    for extension, value in FILE_FORMATS.items():
+        if name.endswith(extension):
+            return value
+    return None
+
+
+def base_type(column_type: str) -> str:
+    return re.sub(r"\([^)]*\)", "", column_type).strip().lower()
+
+
+def arrow_type(column_type: str):
+    name = base_type(column_type)
+    if name in ("numeric", "decimal"):
+        # numeric(p, s) fits decimal128 up to 38 digits, unbounded numeric is written as text
+        modifiers = [int(value) for value in re.findall(r"\d+", column_type)]
+        if modifiers and modifiers[0] <= 38:
+            return pa.decimal128(modifiers[0], modifiers[1] if len(modifiers) > 1 else 0)
+        return pa.string()
+    return {
+        "int": pa.int32(),
+        "integer": pa.int32(),
+        "int4": pa.int32(),
+        "bigint": pa.int64(),
+        "int8": pa.int64(),
+        "smallint": pa.int16(),
+        "int2": pa.int16(),
+        "boolean": pa.bool_(),
+        "bool": pa.bool_(),
+        "float": pa.float64(),
+        "double precision": pa.float64(),
+        "float8": pa.float64(),
+        "real": pa.float32(),
+        "float4": pa.float32(),
+        "date": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "timestamp without time zone": pa.timestamp("us"),
+        "timestamptz": pa.timestamp("us", tz="UTC"),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+    }.get(name, pa.string())
+
+
+def text_fallback(column_type: str) -> bool:
+    # Types without an Arrow counterpart (uuid, json, arrays, ...) are written as their text
+    return arrow_type(column_type) == pa.string() and base_type(column_type) not in TEXT_TYPES
+
+
+def to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def arrow_schema(columns: List[str], types: List[str]):
+    require_pyarrow()
+    return pa.schema([pa.field(name, arrow_type(column_type)) for name, column_type in zip(columns, types)])
+
+
+class ColumnarImportPipeline(ImportPipeline):
+    def __init__(self, filepath: str, columns: List[str], types: List[str],
+                 columnar_format: COLUMNAR_FORMATS = None,
+                 batch_rows: int = DEFAULT_BATCH_ROWS):
+        require_pyarrow()
+        super().__init__(filepath, types, chunk_size=batch_rows)
+        self.columns = columns
+        self.columnar_format = columnar_format or detect_columnar_format(filepath)
+        self.schema = arrow_schema(columns, types)
+        if self.columnar_format not in FILE_FORMATS.values():
+            raise Exception(f"Unknown columnar format: {filepath}")
+
+    def record_batches(self) -> Iterator[tuple]:
+        # Yields (batch, share of the file read so far or None when unknown)
+        if self.columnar_format == "parquet":
+            parquet_file = pq.ParquetFile(self.filepath)
+            total_rows = parquet_file.metadata.num_rows
+            rows_read = 0
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size):
+                rows_read += batch.num_rows
+                yield batch, rows_read / total_rows if total_rows else None
+            return
+        with pa.memory_map(self.filepath) as source:
+            try:
+                reader = ipc.open_file(source)
+            except pa.ArrowInvalid:
+                # Not the random-access file format, read it as an IPC stream
+                source.seek(0)
+                for batch in ipc.open_stream(source):
+                    yield batch, None
+                return
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i), (i + 1) / reader.num_record_batches
+
+    def count_rows(self) -> int:
+        if self.columnar_format == "parquet":
+            return pq.ParquetFile(self.filepath).metadata.num_rows
+        # Record batches of a memory-mapped IPC file are read without copying
+        return sum(batch.num_rows for batch, _ in self.record_batches())
+
+    def conform(self, batch):
+        # Columns are matched by name when the file has them all, otherwise by position
+        if all(name in batch.schema.names for name in self.columns):
+            arrays = [batch.column(batch.schema.get_field_index(name)) for name in self.columns]
+        elif batch.num_columns == len(self.columns):
+            arrays = batch.columns
+        else:
+            raise Exception("File columns do not match the table columns")
+        arrays = [array.cast(field.type) for array, field in zip(arrays, self.schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def chunks(self, start: int = 0, start_row: int = 0) -> Iterator[list]:
+        # Batch boundaries are not byte offsets here, a resumed run skips start_row rows instead
+        self.rows_count = 0
+        self.bytes_read = 0
+        for batch, share in self.record_batches():
+            if self.rows_count + batch.num_rows <= start_row:
+                self.rows_count += batch.num_rows
+                continue
+            if self.rows_count < start_row:
+                batch = batch.slice(start_row - self.rows_count)
+                self.rows_count = start_row
+            with timed("import_parse", pipeline=self.columnar_format) as span:
+                batch = self.conform(batch)
+                chunk = list(zip(*(column.to_pylist() for column in batch.columns)))
+                span.add(rows=len(chunk), bytes=batch.nbytes)
+            self.rows_count += len(chunk)
+            if share is not None:
+                self.bytes_read = int(self.total_bytes * share)
+            yield chunk
+        self.bytes_read = self.total_bytes
+
+    def preview(self, rows: int = 100) -> list:
+        for chunk in self.chunks():
+            return chunk[:rows]
+        return []
+
+
+class ColumnarExporter:
+    def __init__(self, table,
+                 columnar_format: COLUMNAR_FORMATS = "parquet",
+                 batch_rows: int = DEFAULT_BATCH_ROWS,
+                 compression: str = "zstd"):
+        require_pyarrow()
+        self.table = table
+        self.columnar_format = columnar_format
+        self.batch_rows = batch_rows
+        self.compression = compression
+        self.schema = arrow_schema(table.columns, table.columns_types)
+        self.text_columns = [text_fallback(column_type) for column_type in table.columns_types]
+        self.rows_count = 0
+
+    def open_writer(self, file_name: str):
+        if self.columnar_format == "parquet":
+            return pq.ParquetWriter(file_name, self.schema, compression=self.compression)
+        return ipc.new_file(file_name, self.schema,
+                            options=ipc.IpcWriteOptions(compression=self.compression))
+
+    def export(self, file_name: str) -> int:
+        # Every cursor batch becomes one Parquet row group / one Arrow record batch
+        self.rows_count = 0
+        with timed("table_export", table=self.table.name, format=self.columnar_format) as span:
+            writer = self.open_writer(file_name)
+            try:
+                for rows in self.table.iter_data(itersize=self.batch_rows):
+                    arrays = [
+                        pa.array([to_text(value) for value in values] if as_text else values, type=field.type)
+                        for values, field, as_text in zip(zip(*rows), self.schema, self.text_columns)
+                    ]
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+                    self.rows_count += len(rows)
+            finally:
+                writer.close()
+            span.add(rows=self.rows_count, bytes=os.path.getsize(file_name))
+        return self.rows_count
@@ -0,0 +1,115 @@
+import gzip
+import io
+import os
+from typing import Literal, Optional
+
+from prettytable import PrettyTable
+from psycopg2 import sql
+
+from metrics import timed
+
+EXPORT_FORMATS = Literal[
+    "text",
+    "tsv",
+    "csv",
+]
+COMPRESSIONS = Literal[
+    "gzip",
+    "zstd",
+]
+DEFAULT_PAGE_ROWS = 1000
+FILE_FORMATS = {
+    ".txt": "text",
+    ".tsv": "tsv",
+    ".csv": "csv",
+}
+FILE_COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+
+
+def detect_format(file_name: str) -> tuple:
+    # "table.csv.gz" -> ("csv", "gzip"); unknown extensions fall back to the text dump
+    name = file_name.lower()
+    compression = None
+    for extension, value in FILE_COMPRESSIONS.items():
+        if name.endswith(extension):
+            compression = value
+            name = name[:-len(extension)]
+            break
+    export_format = "text"
+    for extension, value in FILE_FORMATS.items():
+        if name.endswith(extension):
+            export_format = value
+            break
+    return export_format, compression
+
+
+def open_output(file_name: str, compression: Optional[COMPRESSIONS] = None):
+    if compression is None:
+        return open(file_name, "wb")
+    if compression == "gzip":
+        return gzip.open(file_name, "wb", compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor().stream_writer(open(file_name, "wb"))
+    raise Exception(f"Unknown compression: {compression}")
+
+
+class TableExporter:
+    def __init__(self, table,
+                 export_format: EXPORT_FORMATS = "text",
+                 compression: Optional[COMPRESSIONS] = None,
+                 page_rows: int = DEFAULT_PAGE_ROWS):
+        if export_format not in FILE_FORMATS.values():
+            raise Exception(f"Unknown export format: {export_format}")
+        self.table = table
+        self.export_format = export_format
+        self.compression = compression
+        self.page_rows = page_rows
+        self.rows_count = 0
+
+    def copy_query(self) -> sql.Composed:
+        # TSV uses COPY's text format: backslashes, tabs and newlines come out escaped and NULL as \N,
+        # the importer does not undo either
+        options = "FORMAT csv, HEADER true" if self.export_format == "csv" else "FORMAT text"
+        source = sql.Identifier(self.table.name)
+        # COPY reads plain tables only, partitioned tables, views and foreign tables go through a query
+        if self.table.database.catalog.table(self.table.name).kind != "r":
+            source = sql.SQL("(SELECT * FROM {})").format(source)
+        return sql.SQL("COPY {} TO STDOUT WITH ({})").format(source, sql.SQL(options))
+
+    def export(self, file_name: str) -> int:
+        self.rows_count = 0
+        with timed("table_export", table=self.table.name, format=self.export_format) as span:
+            with open_output(file_name, self.compression) as output:
+                if self.export_format == "text":
+                    self.write_pages(output)
+                else:
+                    self.write_copy(output)
+            span.add(rows=self.rows_count, bytes=os.path.getsize(file_name))
+        return self.rows_count
+
+    def write_copy(self, output):
+        # copy_expert streams the server output into the file block by block
+        with self.table.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(self.copy_query(), output)
+                self.rows_count = cursor.rowcount
+
+    def write_pages(self, output):
+        writer = io.TextIOWrapper(output, encoding="utf-8", write_through=True)
+        try:
+            for rows in self.table.iter_data(itersize=self.page_rows):
+                page = PrettyTable()
+                page.field_names = self.table.columns
+                page.add_rows(rows)
+                writer.write(page.get_string())
+                writer.write("\n")
+                self.rows_count += len(rows)
+        finally:
+            writer.detach()
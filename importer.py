@@ -0,0 +1,219 @@
+import multiprocessing as mp
+import os
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional
+
+from metrics import timed
+from postgres.copy_loader import normalize_type
+
+DEFAULT_CHUNK_SIZE = 50_000
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+DEFAULT_POOL_SIZE = mp.cpu_count()
+COUNT_BLOCK_SIZE = 1024 * 1024
+FIELDS_SEPARATOR = "\t"
+TIMESTAMP_LAYOUT = "YYYY-MM-DD HH:MM:SS[.ffffff]"
+
+
+class RowParseError(Exception):
+    def __init__(self, row: int, column: int, value: str, column_type: str):
+        super().__init__(row, column, value, column_type)
+        self.row = row
+        self.column = column
+        self.value = value
+        self.column_type = column_type
+
+    def __str__(self):
+        if self.column_type is None:
+            return f"Row {self.row}: expected {self.column} fields, got {self.value}"
+        return f"Row {self.row}, column {self.column}: cannot convert {self.value!r} to {self.column_type}"
+
+    def shifted(self, rows: int) -> "RowParseError":
+        return RowParseError(self.row + rows, self.column, self.value, self.column_type)
+
+
+def parse_timestamp(value: str) -> datetime:
+    # Only "YYYY-MM-DD HH:MM:SS[.ffffff]": fromisoformat would also take dates alone and UTC offsets
+    length = len(value)
+    if ((length == 19 or 21 <= length <= 26 and value[19] == ".") and value[4] == value[7] == "-"
+            and value[10] == " " and value[13] == value[16] == ":"):
+        digits = value[:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19] + value[20:]
+        if digits.isascii() and digits.isdigit():
+            return datetime(int(value[:4]), int(value[5:7]), int(value[8:10]), int(value[11:13]),
+                            int(value[14:16]), int(value[17:19]), int(value[20:].ljust(6, "0")) if length > 19 else 0)
+    raise ValueError("Timestamp {!r} does not match {}".format(value, TIMESTAMP_LAYOUT))
+
+
+CONVERTERS = {
+    "int": int,
+    "float": float,
+    "text": str,
+    "timestamp": parse_timestamp,
+}
+
+
+@lru_cache(maxsize=None)
+def compile_converters(types: tuple) -> tuple:
+    return tuple(CONVERTERS[normalize_type(column_type)] for column_type in types)
+
+
+def _locate_error(types: tuple, converters: tuple, rows_fields: List[list], first_row: int):
+    for row_index, fields in enumerate(rows_fields, start=first_row):
+        if len(fields) != len(converters):
+            raise RowParseError(row_index, len(converters), len(fields), None)
+        for column_index, (convert, value) in enumerate(zip(converters, fields), start=1):
+            try:
+                convert(value)
+            except (TypeError, ValueError):
+                raise RowParseError(row_index, column_index, value, types[column_index - 1]) from None
+
+
+def parse_rows(types: List[str], rows_fields: List[list], first_row: int = 1) -> list:
+    types = tuple(types)
+    converters = compile_converters(types)
+    width = len(converters)
+    try:
+        if any(len(fields) != width for fields in rows_fields):
+            raise ValueError
+        return [[convert(value) for convert, value in zip(converters, fields)] for fields in rows_fields]
+    except (TypeError, ValueError):
+        _locate_error(types, converters, rows_fields, first_row)
+        raise
+
+
+def types_parse(types: List[str], data: List[str]) -> list:
+    return parse_rows(types, [data])[0]
+
+
+def count_lines(filepath: str) -> int:
+    # Same rule as iter_lines: lines left empty once the line break is stripped are not rows
+    with open(filepath, "rb", buffering=COUNT_BLOCK_SIZE) as file:
+        return sum(1 for line in file if line.rstrip(b"\r\n"))
+
+
+def iter_lines(filepath: str, start: int = 0) -> Iterator[tuple]:
+    # Yields (fields, offset after the line); binary mode keeps offsets exact
+    offset = start
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        for raw_line in file:
+            offset += len(raw_line)
+            line = raw_line.decode("utf-8").rstrip("\r\n")
+            if line:
+                yield line.split(FIELDS_SEPARATOR), offset
+
+
+def split_ranges(filepath: str, range_size: int = DEFAULT_RANGE_SIZE, start: int = 0) -> List[tuple]:
+    # Cuts the file into (start, end) byte ranges that always end on a line boundary
+    ranges = []
+    total_bytes = os.path.getsize(filepath)
+    with open(filepath, "rb") as file:
+        while start < total_bytes:
+            file.seek(min(start + range_size, total_bytes))
+            file.readline()
+            end = min(file.tell(), total_bytes)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(filepath: str, start: int, end: int, types: List[str]) -> list:
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start).decode("utf-8")
+    # Split like iter_lines does: str.splitlines would also break on \x0c, \x1c-\x1e, \x85, \u2028 ...
+    lines = (line.rstrip("\r") for line in data.split("\n"))
+    return parse_rows(types, [line.split(FIELDS_SEPARATOR) for line in lines if line])
+
+
+class ImportPipeline:
+    def __init__(self, filepath: str, types: List[str],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.filepath = filepath
+        self.types = types
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(filepath)
+        self.bytes_read = 0
+        self.rows_count = 0
+
+    @property
+    def source(self) -> str:
+        return os.path.abspath(self.filepath)
+
+    def parse_chunk(self, fields_chunk: List[list], chunk_bytes: int) -> list:
+        with timed("import_parse", pipeline="serial") as span:
+            chunk = parse_rows(self.types, fields_chunk, self.rows_count + 1)
+            span.add(rows=len(chunk), bytes=chunk_bytes)
+        return chunk
+
+    def chunks(self, start: int = 0, start_row: int = 0) -> Iterator[list]:
+        # start must be a line boundary, e.g. the bytes_read of an earlier run
+        self.rows_count = start_row
+        self.bytes_read = start
+        fields_chunk = []
+        for fields, offset in iter_lines(self.filepath, start):
+            fields_chunk.append(fields)
+            if len(fields_chunk) >= self.chunk_size:
+                chunk = self.parse_chunk(fields_chunk, offset - self.bytes_read)
+                self.bytes_read = offset
+                self.rows_count += len(chunk)
+                yield chunk
+                fields_chunk = []
+        chunk_bytes = self.total_bytes - self.bytes_read
+        self.bytes_read = self.total_bytes
+        if fields_chunk:
+            chunk = self.parse_chunk(fields_chunk, chunk_bytes)
+            self.rows_count += len(chunk)
+            yield chunk
+
+    def preview(self, rows: int = 100) -> list:
+        preview = []
+        for fields, _ in iter_lines(self.filepath):
+            preview.append(fields)
+            if len(preview) >= rows:
+                break
+        return parse_rows(self.types, preview)
+
+    def run(self, table, progress: Optional[Callable[[int, int, int], None]] = None,
+            workers: int = 1, staging: bool = True) -> bool:
+        def on_chunk(rows_loaded: int):
+            if progress:
+                progress(rows_loaded, self.bytes_read, self.total_bytes)
+
+        return table.insert_batches(self.chunks(), progress=on_chunk, workers=workers, staging=staging)
+
+
+class ParallelImportPipeline(ImportPipeline):
+    def __init__(self, filepath: str, types: List[str],
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 range_size: int = DEFAULT_RANGE_SIZE):
+        super().__init__(filepath, types)
+        self.pool_size = max(1, pool_size)
+        self.range_size = range_size
+
+    def chunks(self, start: int = 0, start_row: int = 0) -> Iterator[list]:
+        ranges = deque(split_ranges(self.filepath, self.range_size, start))
+        pending = deque()
+        self.rows_count = start_row
+        self.bytes_read = start
+        # Keep only a few ranges in flight so parsed chunks never pile up in memory
+        max_pending = self.pool_size * 2
+        with mp.Pool(self.pool_size) as pool:
+            while ranges or pending:
+                while ranges and len(pending) < max_pending:
+                    start, end = ranges.popleft()
+                    pending.append((end, pool.apply_async(parse_range, (self.filepath, start, end, self.types))))
+                end, result = pending.popleft()
+                # Workers parse in their own processes, so this measures how long the loader waits on them
+                with timed("import_parse", pipeline="parallel") as span:
+                    try:
+                        chunk = result.get()
+                    except RowParseError as _ex:
+                        raise _ex.shifted(self.rows_count) from None
+                    span.add(rows=len(chunk), bytes=end - self.bytes_read)
+                self.bytes_read = end
+                self.rows_count += len(chunk)
+                yield chunk
+            pool.close()
+            pool.join()
@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from typing import Any, Callable, List, Tuple
+import tkinter as tk
+from tkinter import ttk
+from tkinter.ttk import Treeview
+
+# fetch_page(after_key, limit) -> (rows, last_key)
+FetchPage = Callable[[Any, int], Tuple[list, Any]]
+# seek(fraction) -> an estimated key about that fraction of the rows come before, None if it cannot tell
+Seek = Callable[[float], Any]
+
+# Farther than this from a known page start, a jump seeks to an estimated key instead of reading every page between
+MAX_WALK_PAGES = 4
+
+
+class PagedRows:
+    def __init__(self, fetch_page: FetchPage, page_size: int = 200, max_pages: int = 50, seek: Seek = None):
+        self.fetch_page = fetch_page
+        self.seek = seek
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.rows_count = 0
+        self.pages = OrderedDict()
+        # anchors[i] is the key the page i starts after; page 0 starts at the beginning
+        self.anchors = {0: None}
+        self.exhausted_at = None
+
+    def clear(self):
+        self.pages.clear()
+        self.anchors = {0: None}
+        self.exhausted_at = None
+
+    def _load_page(self, index: int) -> list:
+        nearest = max(i for i in self.anchors if i <= index)
+        if index - nearest > MAX_WALK_PAGES and self.seek and self.rows_count:
+            # Page starts found this way are estimates, pages around them may overlap or leave gaps
+            key = self.seek(min(1.0, index * self.page_size / self.rows_count))
+            if key is not None:
+                self.anchors[index] = key
+                nearest = index
+        for i in range(nearest, index):
+            self.get_page(i)
+            if i + 1 not in self.anchors:
+                return []
+        rows, last_key = self.fetch_page(self.anchors[index], self.page_size)
+        if len(rows) == self.page_size:
+            self.anchors[index + 1] = last_key
+        else:
+            self.exhausted_at = index
+        return rows
+
+    def get_page(self, index: int) -> list:
+        if self.exhausted_at is not None and index > self.exhausted_at:
+            return []
+        if index in self.pages:
+            self.pages.move_to_end(index)
+            return self.pages[index]
+        rows = self._load_page(index)
+        self.pages[index] = rows
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return rows
+
+    def cached_page(self, index: int):
+        # Never fetches, None when the page is not loaded yet; safe while a worker loads other pages
+        if self.exhausted_at is not None and index > self.exhausted_at:
+            return []
+        return self.pages.get(index)
+
+    def get_rows(self, start: int, count: int, cached_only: bool = False):
+        rows = []
+        first_page = start // self.page_size
+        last_page = (start + count - 1) // self.page_size
+        for index in range(first_page, last_page + 1):
+            page = self.cached_page(index) if cached_only else self.get_page(index)
+            if page is None:
+                return None
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+        skip = start - first_page * self.page_size
+        return rows[skip:skip + count]
+
+
+class VirtualTreeview:
+    def __init__(self, master, columns: List[str],
+                 fetch_page: FetchPage,
+                 rows_count: int,
+                 visible_rows: int = 30,
+                 page_size: int = 200,
+                 prefetch_rows: int = 100,
+                 seek: Seek = None,
+                 tasks=None,
+                 on_error: Callable = None):
+        # With a TaskExecutor pages are fetched in its workers, without one render fetches them itself
+        self.rows = PagedRows(fetch_page, page_size, seek=seek)
+        self.rows_count = rows_count
+        self.visible_rows = visible_rows
+        self.prefetch_rows = prefetch_rows
+        self.first_row = 0
+        self.columns = columns
+        self.tasks = tasks
+        self.on_error = on_error
+        self.loading = False
+        self.stale = False
+
+        self.frame = tk.Frame(master)
+        self.tree = Treeview(self.frame, columns=columns, show="headings", height=visible_rows)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill=tk.BOTH, expand=1)
+
+        for column in columns:
+            self.tree.heading(column, text=column, anchor=tk.W)
+
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll_to(self.first_row - 3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll_to(self.first_row + 3))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        self.scroll_to(self.first_row + step * 3)
+
+    def on_scroll(self, action: str, value: str, unit: str = None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * self.rows_count))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first_row + int(value) * step)
+
+    def scroll_to(self, first_row: int):
+        first_row = max(0, min(first_row, self.rows_count - self.visible_rows))
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.render()
+
+    def refresh(self, rows_count: int = None):
+        if rows_count is not None:
+            self.rows_count = rows_count
+        if self.loading:
+            # The running load still writes into the page cache, it is cleared once the load is back
+            self.stale = True
+            return
+        self.rows.clear()
+        self.render()
+
+    def render(self):
+        # Loading the prefetch margin keeps the next scroll steps in the page cache
+        requested = self.visible_rows + self.prefetch_rows
+        self.rows.rows_count = self.rows_count
+        if self.tasks is None:
+            self.show(self.rows.get_rows(self.first_row, requested), requested)
+            return
+        rows = self.rows.get_rows(self.first_row, requested, cached_only=True)
+        if rows is None:
+            self.show_placeholders()
+            self.load(self.first_row, requested)
+            return
+        self.show(rows, requested)
+
+    def load(self, first_row: int, requested: int):
+        # One load at a time: when it is back, render runs again for wherever the view has moved meanwhile
+        if self.loading:
+            return
+        self.loading = True
+        self.tasks.submit(lambda task: self.rows.get_rows(first_row, requested),
+                          on_done=self.loaded, on_error=self.load_failed)
+
+    def loaded(self, rows: list):
+        self.loading = False
+        if self.stale:
+            self.stale = False
+            self.rows.clear()
+        self.render()
+
+    def load_failed(self, error: Exception):
+        self.loading = False
+        if self.on_error:
+            self.on_error(error)
+
+    def show_placeholders(self):
+        self.tree.delete(*self.tree.get_children())
+        for _ in range(max(0, min(self.visible_rows, self.rows_count - self.first_row))):
+            self.tree.insert("", tk.END, values=["…"] * len(self.columns))
+        self.update_scrollbar()
+
+    def show(self, rows: list, requested: int):
+        # rows_count may be an estimate: correct it once the real end of the table is seen
+        if len(rows) < requested:
+            self.rows_count = self.first_row + len(rows)
+            if len(rows) < self.visible_rows and self.first_row > 0:
+                self.first_row = max(0, self.rows_count - self.visible_rows)
+                self.render()
+                return
+        else:
+            self.rows_count = max(self.rows_count, self.first_row + len(rows))
+        self.tree.delete(*self.tree.get_children())
+        for row in rows[:self.visible_rows]:
+            self.tree.insert("", tk.END, values=row)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        if self.rows_count:
+            self.scrollbar.set(self.first_row / self.rows_count,
+                               min(1.0, (self.first_row + self.visible_rows) / self.rows_count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
@@ -1,56 +1,62 @@
-from contextlib import closing
-from datetime import datetime
-import multiprocessing as mp
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from functools import partial
+from itertools import count
 from tkinter import Tk, ttk
 import tkinter as tk
 import tkinter.messagebox as mb
 from tkinter.filedialog import asksaveasfilename, askopenfilename
 from tkinter.font import Font
-from tkinter.ttk import Treeview
-from typing import List
+from typing import List, Dict, Iterable, Iterator, Callable
 
+import numpy as np
 import psycopg2
-from prettytable import PrettyTable
 from psycopg2 import sql
-from psycopg2.extras import DictCursor
-import matplotlib.pyplot as plt
-from numpy import exp, array
-import numpy as np
-
-
-def build_chart(x_values: list,
-                y_values: list,
-                x_label: str,
-                y_label: str,
-                title: str):
-    if len(x_values) != len(y_values):
-        return
-
-    values_x = array(x_values)
-    values_y = array(y_values)
-
-    for x in values_x:
-        plt.axvline(x=x)
-
-    plt.plot(x_values, y_values, "bo")
 
-    p = np.polyfit(values_x, values_y, 1)
-    f = np.poly1d(p)
-    plt.plot(values_x, f(values_x), 'b--', label='Approximation')
-
-    plt.ylim([0, y_values[len(y_values) - 1] + y_values[0]])
-    plt.xlim([0, x_values[len(x_values) - 1] + x_values[0]])
-
-    for xy in zip(x_values, y_values):
-        _xy = (xy[0], xy[1] - (y_values[0] / 2))
-        plt.annotate('(%.4f)' % xy[1], xy=_xy)
-
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-
-    plt.title(title)
-    plt.grid()
-    plt.show()
+from arrays import fetch_arrays
+from benchmark import Benchmark, plot_results
+from columnar import ColumnarExporter, ColumnarImportPipeline, detect_columnar_format
+from exporter import TableExporter, EXPORT_FORMATS, COMPRESSIONS, detect_format
+from importer import ImportPipeline, ParallelImportPipeline, DEFAULT_POOL_SIZE, count_lines, types_parse
+from interface.elements.virtual_tree import VirtualTreeview
+from metrics import timed
+from postgres.catalog import Catalog, ESTIMATE_QUERY, HEAPS_QUERY, KEY_BOUND_QUERY, pick_estimate
+from postgres.checkpoints import Checkpoint, CheckpointStore
+from postgres.copy_loader import CopyLoader, COPY_FORMATS, DEFAULT_BATCH_SIZE, batched
+from postgres.partitions import PartitionedCopyLoader, RangePartitioning, PARTITIONS_QUERY
+from postgres.parallel_loader import ParallelCopyLoader, DEFAULT_WORKERS as DEFAULT_LOAD_WORKERS
+from postgres.pool import ConnectionPool, ConnectionSettings
+from postgres.prepared import PreparedStatements
+from postgres.builder_source import AND, GREATER, LESS
+from postgres.query_builder import QueryBuilder, SelectParameters
+from postgres.result_cache import ResultCache, MISS
+from postgres.staging import drop_stale_staging, holding_staging, staging_name
+from tasks import Task, TaskExecutor, bind, current_task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ITERSIZE = 2000
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_INDEX_WORKERS = 4
+INITIAL_ARRAY_BATCHES = 4
+SYSTEM_KEY_COLUMNS = ("tableoid", "ctid")
+DEFAULT_PAGE_BLOCKS = 8
+EXPORT_FILE_TYPES = (
+    ("Текстовая таблица", "*.txt"),
+    ("TSV", "*.tsv"),
+    ("CSV", "*.csv"),
+    ("Сжатый CSV (gzip)", "*.csv.gz"),
+    ("Сжатый TSV (gzip)", "*.tsv.gz"),
+    ("Сжатый CSV (zstd)", "*.csv.zst"),
+    ("Parquet", "*.parquet"),
+    ("Arrow", "*.arrow"),
+)
+IMPORT_FILE_TYPES = (
+    ("text files", "*.txt"),
+    ("Parquet", "*.parquet"),
+    ("Arrow", "*.arrow *.feather"),
+)
 
 
 class User:
@@ -60,31 +66,70 @@ class User:
 
 
 class Database:
-    def __init__(self, user: User, db_name):
+    def __init__(self, user: User, db_name,
+                 host: str = "localhost",
+                 port: int = 5432,
+                 min_connections: int = 1,
+                 max_connections: int = 10,
+                 idle_timeout: float = 300.0,
+                 **options):
         self.db_name = db_name
         self.user = user
-        self.connection = self.connect()
-        self.tables = self._get_tables() if self.connection else []
-        print(self.tables)
-
-    def connect(self):
-        connection = None
+        self.settings = ConnectionSettings(
+            database=db_name, user=user.username, password=user.password,
+            host=host, port=port, **options
+        )
+        self.pool = self.connect(min_connections, max_connections, idle_timeout)
+        self.catalog = Catalog(self.connection)
+        self.prepared = PreparedStatements()
+        self.cache = ResultCache()
+        self.tables = self._get_tables() if self.pool else []
+        logger.debug("Tables in %s: %s", db_name, self.tables)
+
+    def connect(self, min_connections: int = 1,
+                max_connections: int = 10,
+                idle_timeout: float = 300.0):
+        pool = None
         try:
-            connection = psycopg2.connect(
-                database=self.db_name, user=self.user.username,
-                password=self.user.password,
-                host='localhost'
-            )
+            pool = ConnectionPool(self.settings,
+                                  min_size=min_connections,
+                                  max_size=max_connections,
+                                  idle_timeout=idle_timeout)
         except psycopg2.Error as err:
-            print(err)
-        return connection
+            logger.error("Cannot connect to %s: %s", self.db_name, err)
+        return pool
+
+    @contextmanager
+    def connection(self, task: Task = None):
+        # Cancelling the task running in this thread interrupts the query on the server too;
+        # a task that is already cancelled keeps its connections for cleanup
+        task = task or current_task()
+        with self.pool.connection() as conn:
+            if task is None or task.cancelled:
+                yield conn
+                return
+            task.on_cancel(conn.cancel)
+            try:
+                yield conn
+            finally:
+                task.remove_cancel(conn.cancel)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+
+    def hold_staging(self, names: List[str]):
+        return holding_staging(self.pool, names)
+
+    def drop_stale_staging(self) -> List[str]:
+        # Staging tables left behind by loads that crashed at least a day ago; tables of running loads are locked
+        dropped = drop_stale_staging(self.connection)
+        if dropped:
+            logger.info("Dropped stale staging tables: %s", ", ".join(dropped))
+        return dropped
 
     def _get_tables(self) -> list:
-        tables = []
-        with self.connection.cursor(cursor_factory=DictCursor) as cursor:
-            cursor.execute("SELECT * FROM information_schema.tables WHERE table_schema='public'")
-            tables = [item[2] for item in cursor.fetchall()]
-        return tables
+        return [name for name, info in self.catalog.tables.items() if not info.staging]
 
     def get_table(self, table_name: str):
         return Table(
@@ -92,71 +137,309 @@ class Database:
             table_name
         )
 
-    def refresh_info(self):
+    def refresh_info(self, reload: bool = False):
+        if reload:
+            self.catalog.invalidate()
+            self.cache.clear()
         self.tables = self._get_tables()
 
 
 class Table:
     ALLOWED_SYMBOLS = "abcdefghijklmnopqrstuvwxyz_0123456789"
+    _cursor_counter = count()
 
     def __init__(self, database: Database, table_name: str):
         self.database = database
         self.name = table_name
-        self.get_data_timedelta = 0
-        self.data_prepare_timedelta = 0
-        self.data_insert_timedelta = 0
+        # Seconds spent by the last read and insert, the same spans also go to the metrics registry
+        self.timings = {"read": 0, "encode": 0, "copy": 0}
+        self.key_columns = None
+        self.index_errors: List[str] = []
         self.columns_types = self.get_columns_types()
-        print(self.columns_types)
+        logger.debug("Column types of %s: %s", table_name, self.columns_types)
         self.columns = self.get_columns()
+        self.partitioning = self.get_partitioning()
         # self.data = self.get_data()
 
     def get_columns(self):
-        with self.database.connection as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(f"SELECT * FROM {self.name} LIMIT 1")
-                columns = [item[0] for item in cursor.description]
-        return columns
+        return self.database.catalog.table(self.name).column_names
 
     def clear_data(self):
         self.data.clear()
 
     def get_columns_types(self):
-        with self.database.connection as conn:
+        return self.database.catalog.table(self.name).column_types
+
+    def get_partitioning(self):
+        info = self.database.catalog.table(self.name)
+        if not info.partitioned:
+            return None
+        return RangePartitioning.from_comment(self.name, self.columns, self.columns_types, info.comment)
+
+    def get_partitions(self) -> List[str]:
+        with self.database.connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(
-                    f"SELECT DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS "
-                    f"where TABLE_NAME = '{self.name}'"
-                )
-                ans = [str(item[0]).replace("integer", "int").replace("double precision", "float") for item in
-                       cursor.fetchall()]
-        return list(reversed(ans))
+                cursor.execute(PARTITIONS_QUERY, (self.name,))
+                return sorted(row[0] for row in cursor.fetchall())
+
+    def drop_partition(self, partition_name: str):
+        # Dropping a whole partition is a catalog operation, no rows are scanned or deleted one by one
+        if partition_name not in self.get_partitions():
+            raise Exception(f"{partition_name} is not a partition of {self.name}")
+        with timed("table_ddl", table=self.name, operation="drop_partition"), self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition_name)))
+        self.invalidate_cache()
+
+    def iter_data(self, itersize: int = DEFAULT_ITERSIZE,
+                  columns: List[str] = None,
+                  where: SelectParameters = None,
+                  operation: QueryBuilder.SELECT_OPERATORS = AND) -> Iterator[list]:
+        cursor_name = "{}_stream_{}".format(self.name, next(self._cursor_counter))
+        with timed("table_read", table=self.name) as span:
+            with self.database.connection() as conn:
+                with conn.cursor(name=cursor_name) as cursor:
+                    cursor.itersize = itersize
+                    query, params = QueryBuilder.select_query(self.name, columns, where, operation)
+                    cursor.execute(QueryBuilder.render(query, conn), params)
+                    while rows := cursor.fetchmany(itersize):
+                        span.add(rows=len(rows))
+                        with span.paused():
+                            yield rows
+        self.timings["read"] = round(span.seconds, 6)
 
     def get_data(self) -> list:
-        with self.database.connection as conn:
-            with conn.cursor() as cursor:
-                start_time = datetime.now()
-                cursor.execute(f"SELECT * FROM {self.name}")
-                data = cursor.fetchall()
-                self.get_data_timedelta = (datetime.now() - start_time).total_seconds()
+        data = []
+        for rows in self.iter_data():
+            data.extend(rows)
         return data
 
-    def get_rows_count(self) -> int:
-        with self.database.connection as conn:
+    def get_arrays(self, columns: List[str] = None,
+                   where: SelectParameters = None,
+                   operation: QueryBuilder.SELECT_OPERATORS = AND,
+                   itersize: int = DEFAULT_ITERSIZE,
+                   fixed_width_text: bool = False) -> Dict[str, np.ndarray]:
+        # One NumPy array per column, filled from the server-side cursor batch by batch
+        columns = list(columns or self.columns)
+        for column in columns:
+            if column not in self.columns:
+                raise Exception(f"Unknown column {column} in table {self.name}")
+        types = [self.columns_types[self.columns.index(column)] for column in columns]
+        # The estimate can be stale or far off, so it only sizes the first few batches and the buffers grow from there
+        capacity = itersize if where else min(max(itersize, self.get_rows_count(exact=False)),
+                                              INITIAL_ARRAY_BATCHES * itersize)
+        return fetch_arrays(self.iter_data(itersize, columns, where, operation), columns, types,
+                            capacity=capacity, fixed_width_text=fixed_width_text)
+
+    def get_key_column(self):
+        return self.database.catalog.table(self.name).key_column
+
+    def get_key_columns(self) -> List[str]:
+        # Single-column primary key if there is one, otherwise pages are keyed by ctid.
+        # ctid is only unique within one partition, so partitioned tables are keyed by (tableoid, ctid)
+        key_column = self.get_key_column()
+        if key_column:
+            return [key_column]
+        return list(SYSTEM_KEY_COLUMNS) if self.database.catalog.table(self.name).partitioned else ["ctid"]
+
+    def get_page(self, after=None, limit: int = DEFAULT_PAGE_SIZE) -> tuple:
+        # after is the last key seen: a single value, or a tuple for a (tableoid, ctid) key
+        if self.key_columns is None:
+            self.key_columns = self.get_key_columns()
+        if self.key_columns[-1] == "ctid":
+            return self.get_heap_page(after, limit)
+        rows, cursor = self.query(after=None if after is None else (after,), limit=limit,
+                                  purpose="page_after" if after is not None else "page_first")
+        return rows, cursor[0] if cursor else cursor
+
+    def get_heaps(self) -> List[tuple]:
+        # (oid, name, blocks, reltuples) of the table, or of each partition of a partitioned table
+        heaps = self.database.cache.get(self.name, ("heaps",))
+        if heaps is not MISS:
+            return heaps
+        generation = self.database.cache.generation(self.name)
+        with self.database.connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(f"SELECT * FROM {self.name}")
-                count = len(cursor.fetchall())
+                cursor.execute(HEAPS_QUERY, (self.name,))
+                heaps = cursor.fetchall()
+        self.database.cache.put(self.name, ("heaps",), heaps, generation=generation)
+        return heaps
+
+    def get_heap_page(self, after=None, limit: int = DEFAULT_PAGE_SIZE) -> tuple:
+        # Keyless tables are read in ctid order a few blocks at a time: "ctid > a AND ctid < b" is a TID range
+        # scan and only the rows of those blocks get sorted, an open "ctid > a" would scan and sort the rest
+        heaps = self.get_heaps()
+        partitioned = len(self.key_columns) == 2
+        oid, ctid = after if partitioned and after is not None else (None, after)
+        start = next((index for index, heap in enumerate(heaps) if heap[0] == oid), 0)
+        selected = self.columns + self.key_columns
+        rows = []
+        for _, heap_name, blocks, reltuples in heaps[start:]:
+            block = int(ctid.strip("()").split(",")[0]) if ctid else 0
+            rows_per_block = reltuples / blocks if blocks and reltuples > 0 else 0
+            window = int(-(-limit // rows_per_block)) + 1 if rows_per_block else DEFAULT_PAGE_BLOCKS
+            while len(rows) < limit and block < blocks:
+                upper = "({},0)".format(block + window)
+                rows.extend(self.query_heap(heap_name, selected, ctid or "(0,0)", upper, limit - len(rows)))
+                # Fewer rows than asked for: the window is used up, the next one is twice as wide
+                ctid, block, window = upper, block + window, window * 2
+            if len(rows) >= limit:
+                break
+            ctid = None
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = tuple(rows[-1][len(self.columns):]) if partitioned else rows[-1][-1]
+        return [row[:len(self.columns)] for row in rows], next_cursor
+
+    def query_heap(self, heap_name: str, selected: List[str], after: str, before: str, limit: int) -> list:
+        predicates = [("ctid", GREATER, after), ("ctid", LESS, before)]
+        query, params = QueryBuilder.select_query(heap_name, selected, predicates, AND, order_by=["ctid"], limit=limit)
+        cache_key = ("heap", heap_name, params)
+        cached = self.database.cache.get(self.name, cache_key)
+        if cached is not MISS:
+            return list(cached)
+        generation = self.database.cache.generation(self.name)
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                with timed("table_query", table=self.name) as span:
+                    # Partitions get a statement each, all of them are invalidated with the parent table
+                    purpose = "page_range" if heap_name == self.name else "page_range_" + heap_name
+                    self.execute_prepared(cursor, purpose, query, params)
+                    rows = cursor.fetchall()
+                    span.add(rows=len(rows))
+        self.timings["read"] = round(span.seconds, 6)
+        self.database.cache.put(self.name, cache_key, tuple(rows), generation=generation)
+        return rows
+
+    def seek(self, fraction: float):
+        # An estimated key about this fraction of the rows come before; pages continue after it like after any
+        # key seen, so a scrollbar jump reads one page instead of everything in front of it
+        if self.key_columns is None:
+            self.key_columns = self.get_key_columns()
+        if self.key_columns[-1] != "ctid":
+            with self.database.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(KEY_BOUND_QUERY, (fraction, self.name, self.key_columns[0]))
+                    row = cursor.fetchone()
+            # Without statistics there is nothing to estimate from
+            return row[0] if row else None
+        heaps = self.get_heaps()
+        target = fraction * sum(heap[2] for heap in heaps)
+        for oid, _, blocks, reltuples in heaps:
+            if target < blocks or oid == heaps[-1][0]:
+                block = min(int(target), blocks)
+                # Line pointers are numbered from 1 within each block, roughly in row order
+                item = int((target - block) * reltuples / blocks) if blocks and reltuples > 0 else 0
+                ctid = "({},{})".format(block, max(item, 0))
+                return (oid, ctid) if len(self.key_columns) == 2 else ctid
+            target -= blocks
+        return None
+
+    def query(self, columns: List[str] = None,
+              where: SelectParameters = None,
+              operation: QueryBuilder.SELECT_OPERATORS = AND,
+              order_by: List[str] = None,
+              descending: bool = False,
+              after: tuple = None,
+              limit: int = DEFAULT_PAGE_SIZE,
+              offset: int = None,
+              purpose: str = None) -> tuple:
+        # Returns (rows, cursor); pass the cursor back as after= for the next page, it is None after the last one
+        if self.key_columns is None:
+            self.key_columns = self.get_key_columns()
+        columns = list(columns or self.columns)
+        order_by = list(order_by or [])
+        # The unique key breaks ties, otherwise rows with equal sort values could be skipped between pages
+        order_by.extend(column for column in self.key_columns if column not in order_by)
+        predicates = QueryBuilder.normalize_predicates(where)
+        for column in columns + order_by + [item[0] for item in predicates]:
+            if column not in self.columns and column not in SYSTEM_KEY_COLUMNS:
+                raise Exception(f"Unknown column {column} in table {self.name}")
+        selected = columns + [column for column in order_by if column not in columns]
+
+        query, params = QueryBuilder.select_query(self.name, selected, predicates, operation,
+                                                  order_by=order_by, descending=descending, after=after,
+                                                  limit=limit, offset=offset)
+        cache_key = ("query", repr(query), params)
+        cached = self.database.cache.get(self.name, cache_key)
+        if cached is not MISS:
+            # Cached rows are a tuple, callers get their own list
+            return list(cached[0]), cached[1]
+        generation = self.database.cache.generation(self.name)
+        with self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                with timed("table_query", table=self.name) as span:
+                    if purpose:
+                        self.execute_prepared(cursor, purpose, query, params)
+                    else:
+                        cursor.execute(QueryBuilder.render(query, conn), params)
+                    rows = cursor.fetchall()
+                    span.add(rows=len(rows))
+        self.timings["read"] = round(span.seconds, 6)
+
+        next_cursor = None
+        if rows and limit is not None and len(rows) == limit:
+            next_cursor = tuple(rows[-1][selected.index(column)] for column in order_by)
+        if len(selected) > len(columns):
+            rows = [row[:len(columns)] for row in rows]
+        self.database.cache.put(self.name, cache_key, (tuple(rows), next_cursor), generation=generation)
+        return rows, next_cursor
+
+    def iter_query(self, columns: List[str] = None,
+                   where: SelectParameters = None,
+                   operation: QueryBuilder.SELECT_OPERATORS = AND,
+                   order_by: List[str] = None,
+                   descending: bool = False,
+                   page_size: int = DEFAULT_ITERSIZE) -> Iterator[list]:
+        after = None
+        while True:
+            rows, after = self.query(columns, where, operation, order_by, descending, after, page_size)
+            if rows:
+                yield rows
+            if after is None:
+                return
+
+    def execute_prepared(self, cursor, purpose: str, query: sql.Composable, params: list = None):
+        self.database.prepared.execute(cursor, self.name, purpose, query, params)
+
+    def get_rows_count(self, exact: bool = True) -> int:
+        count = self.database.cache.get(self.name, ("count", exact))
+        if count is not MISS:
+            return count
+        generation = self.database.cache.generation(self.name)
+        if exact:
+            with timed("table_count", table=self.name), self.database.connection() as conn:
+                with conn.cursor() as cursor:
+                    self.execute_prepared(cursor, "count",
+                                          sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(self.name)))
+                    count = cursor.fetchone()[0]
+        else:
+            count = self.estimate_rows_count()
+        self.database.cache.put(self.name, ("count", exact), count, generation=generation)
         return count
 
-    def record_data(self, file_name: str):
-        mytable = PrettyTable()
-        mytable.field_names = self.columns
-        mytable.add_rows(
-            self.data
-        )
-        with open(file_name, "w") as file:
-            table = mytable.get_string()
-            file.write(table)
-            file.write('\n')
+    def estimate_rows_count(self) -> int:
+        with timed("table_estimate", table=self.name), self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(ESTIMATE_QUERY, (self.name,))
+                estimate = pick_estimate(*cursor.fetchone())
+        return self.get_rows_count(exact=True) if estimate is None else estimate
+
+    def invalidate_cache(self):
+        # Reads of this process are cached on the database, writes through Table drop them
+        self.database.cache.invalidate(self.name)
+
+    def record_data(self, file_name: str,
+                    export_format: EXPORT_FORMATS = None,
+                    compression: COMPRESSIONS = None) -> int:
+        columnar_format = detect_columnar_format(file_name)
+        if columnar_format:
+            return ColumnarExporter(self, columnar_format).export(file_name)
+        detected_format, detected_compression = detect_format(file_name)
+        exporter = TableExporter(self,
+                                 export_format=export_format or detected_format,
+                                 compression=compression or detected_compression)
+        return exporter.export(file_name)
 
     @classmethod
     def value_validate(cls, value: str) -> bool:
@@ -173,94 +456,196 @@ class Table:
     @classmethod
     def create_in_db(cls, table_name: str,
                      table_data: List[dict],
-                     database: Database):
-        sql_query = "CREATE TABLE {}".format(table_name)
-        sql_query += " ("
-
-        for data_item in table_data:
-            column = "{} {}".format(
-                data_item["name"],
-                data_item["type"],
-            )
-            column += " PRIMARY KEY" if data_item["is_unique"] else ""
-            column += " NOT NULL" if data_item["null"] else ""
-            column += ", " if table_data.index(data_item) != len(table_data) - 1 else ")"
-            sql_query += column
-        sql_query += ";"
-
-        with database.connection as conn:
+                     database: Database,
+                     partitioning: dict = None,
+                     unlogged: bool = False):
+        # partitioning: {"column": ..., "interval": "day" | "week" | "month" | "year" | int step}
+        partition = None
+        if partitioning:
+            column_type = next(column["type"] for column in table_data if column["name"] == partitioning["column"])
+            partition = RangePartitioning(table_name, partitioning["column"], column_type, partitioning["interval"])
+        query = QueryBuilder.create_table_query(table_name, table_data,
+                                                partition_by=partition.column if partition else '',
+                                                unlogged=unlogged)
+
+        with timed("table_ddl", table=table_name, operation="create"), database.connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(sql_query)
+                cursor.execute(query)
+                if partition:
+                    # Range partitions are created on demand by the loader, NULL keys need the default one
+                    cursor.execute(partition.create_partition_query(None))
+                    cursor.execute(partition.comment_query())
                 conn.commit()
+        database.catalog.invalidate()
+        database.prepared.invalidate(table_name)
+        database.cache.invalidate(table_name)
 
         return Table(database, table_name)
 
-    def insert_data(self, data: list[list]) -> bool:
+    def swap_into(self, table_name: str) -> "Table":
+        # SET LOGGED and the renames commit together: readers see either no table or the complete one
+        with timed("table_ddl", table=table_name, operation="swap"), self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("ALTER TABLE {} SET LOGGED").format(sql.Identifier(self.name)))
+                cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                    sql.Identifier(self.name), sql.Identifier(table_name)
+                ))
+                cursor.execute(
+                    "SELECT conname FROM pg_catalog.pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+                    (table_name,)
+                )
+                for (constraint_name,) in cursor.fetchall():
+                    cursor.execute(sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+                        sql.Identifier(table_name), sql.Identifier(constraint_name),
+                        sql.Identifier("{}_pkey".format(table_name))
+                    ))
+        self.database.catalog.invalidate()
+        self.database.prepared.invalidate(self.name)
+        self.database.prepared.invalidate(table_name)
+        self.database.cache.invalidate(self.name)
+        self.database.cache.invalidate(table_name)
+        return Table(self.database, table_name)
+
+    def analyze(self):
+        # Fresh statistics, otherwise the planner works from defaults until autovacuum gets to the table
+        with timed("table_analyze", table=self.name), self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(self.name)))
+        self.invalidate_cache()
+
+    def make_loader(self, copy_format: COPY_FORMATS = "text"):
+        if self.partitioning is not None:
+            return PartitionedCopyLoader(self.partitioning, self.columns, self.columns_types, copy_format=copy_format)
+        return CopyLoader(self.name, self.columns, self.columns_types, copy_format=copy_format)
+
+    def insert_batches(self, batches: Iterable[list],
+                       copy_format: COPY_FORMATS = "text",
+                       progress: Callable[[int], None] = None,
+                       workers: int = 1,
+                       staging: bool = True) -> bool:
         status = True
-        values_str = ""
-        self.data_prepare_timedelta = 0
-        data_prepare_start_time = datetime.now()
-        for i in range(len(data)):
-            data_row = "("
-            for j in range(len(data[i])):
-                if type(data[i][j]) is str or type(data[i][j]) is datetime:
-                    data_row += "'{}'".format(str(data[i][j]))
-                else:
-                    data_row += str(data[i][j])
-
-                if j != len(data[i]) - 1:
-                    data_row += ", "
-                else:
-                    data_row += ")"
-            if i % 1000:
-                print(i)
-            values_str += data_row
-
-            if i != len(data) - 1:
-                values_str += ", "
-        self.data_prepare_timedelta = (datetime.now() - data_prepare_start_time).total_seconds()
-
-        insert_query = "INSERT INTO {} VALUES".format(self.name) + values_str + ";"
+        if self.partitioning is not None:
+            # Staging tables cannot create partitions, partitioned loads go through one connection
+            workers = 1
+        if workers > 1:
+            connection = partial(self.database.connection, current_task())
+            loader = ParallelCopyLoader(connection, self.name, self.columns, self.columns_types,
+                                        workers=workers, copy_format=copy_format, staging=staging,
+                                        hold=self.database.hold_staging)
+        else:
+            loader = self.make_loader(copy_format)
         try:
-            with self.database.connection as conn:
-                with conn.cursor() as cursor:
-                    start_time = datetime.now()
-                    cursor.execute(insert_query)
-                    conn.commit()
-                    self.data_insert_timedelta = (datetime.now() - start_time).total_seconds()
-        except Exception as _ex:
-            print(_ex)
+            with timed("table_insert", table=self.name, workers=workers) as span:
+                if workers > 1:
+                    # Workers take their own connections, so nothing may be left uncommitted in this one
+                    loader.load_batches(batches, progress)
+                else:
+                    with self.database.connection() as conn:
+                        loader.load_batches(conn, batches, progress)
+                span.add(rows=loader.rows_count)
+        except Exception:
+            logger.exception("Loading into %s failed", self.name)
             status = False
+        self.invalidate_cache()
+        self.timings["encode"] = round(loader.prepare_time, 6)
+        self.timings["copy"] = round(loader.insert_time, 6)
         return status
 
+    def insert_data(self, data: Iterable[list],
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    copy_format: COPY_FORMATS = "text",
+                    progress: Callable[[int], None] = None,
+                    workers: int = 1) -> bool:
+        return self.insert_batches(batched(data, batch_size), copy_format, progress, workers)
+
+    def insert_resumable(self, pipeline: ImportPipeline,
+                         progress: Callable[[int, int, int], None] = None,
+                         copy_format: COPY_FORMATS = "text") -> int:
+        # Every batch commits together with its checkpoint, so a rerun never loads a batch twice
+        store = CheckpointStore(self.database.connection)
+        checkpoint = store.load(self.name, pipeline.source)
+        if checkpoint is None:
+            checkpoint = Checkpoint(self.name, pipeline.source, pipeline.total_bytes)
+        elif checkpoint.file_size != pipeline.total_bytes:
+            raise Exception("Файл {} изменился после прерванной загрузки".format(pipeline.source))
+        loader = self.make_loader(copy_format)
+        try:
+            with timed("table_insert", table=self.name, workers=1) as span:
+                for chunk in pipeline.chunks(checkpoint.bytes_read, checkpoint.rows_count):
+                    with self.database.connection() as conn:
+                        with conn.cursor() as cursor:
+                            loader.copy_batch(cursor, chunk)
+                            checkpoint.bytes_read = pipeline.bytes_read
+                            checkpoint.rows_count = pipeline.rows_count
+                            store.save(cursor, checkpoint)
+                    if progress:
+                        progress(pipeline.rows_count, pipeline.bytes_read, pipeline.total_bytes)
+                span.add(rows=loader.rows_count)
+        finally:
+            self.invalidate_cache()
+            self.timings["encode"] = round(loader.prepare_time, 6)
+            self.timings["copy"] = round(loader.insert_time, 6)
+        store.clear(self.name, pipeline.source)
+        return checkpoint.rows_count
+
+    def create_indexes(self, indexes: List[dict], workers: int = DEFAULT_INDEX_WORKERS) -> List[str]:
+        # Built after the load: one sort per index instead of per-row maintenance during COPY
+        if not indexes:
+            return []
+        workers = max(1, min(workers, len(indexes), self.database.pool.max_size - 1))
+        self.index_errors = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="index") as executor:
+            create_index = bind(self.create_index)
+            futures = [executor.submit(create_index, index["columns"], index["method"]) for index in indexes]
+            # The rows are committed by now, a failed index is reported on its own instead of failing the load
+            for index, future in zip(indexes, futures):
+                try:
+                    future.result()
+                except Exception as _ex:
+                    logger.error("Index %s on %s failed: %s", index, self.name, _ex)
+                    self.index_errors.append("{} ({}): {}".format(", ".join(index["columns"]), index["method"], _ex))
+        self.database.prepared.invalidate(self.name)
+        return self.index_errors
+
+    def create_index(self, columns: List[str], method: str = "btree"):
+        query = QueryBuilder.create_index_query(self.name, columns, method)
+        with timed("table_index", table=self.name, method=method), self.database.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+
     def delete_from_db(self):
-        with self.database.connection as conn:
+        with timed("table_ddl", table=self.name, operation="drop"), self.database.connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("DROP TABLE {};".format(self.name))
+                cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(self.name)))
                 conn.commit()
+        self.database.catalog.invalidate()
+        self.database.prepared.invalidate(self.name)
+        self.invalidate_cache()
 
     def get_query_time(self, limit: int):
-        with self.database.connection as conn:
+        with self.database.connection() as conn:
             with conn.cursor() as cursor:
-                start_time = datetime.now()
-                cursor.execute(f"SELECT * FROM {self.name} LIMIT {limit}")
-                data = cursor.fetchall()
-                data_timedelta = round((datetime.now() - start_time).total_seconds(), 6)
-        return data_timedelta
+                query, params = QueryBuilder.select_query(self.name, limit=limit)
+                with timed("table_limit", table=self.name) as span:
+                    self.execute_prepared(cursor, "limit", query, params)
+                    span.add(rows=len(cursor.fetchall()))
+        return round(span.seconds, 6)
 
 
 class QueryManager:
     @staticmethod
-    def create_database(db_name: str, username: str, password: str) -> Database:
-        with closing(psycopg2.connect(user=username, password=password)) as conn:
+    def create_database(db_name: str, username: str, password: str,
+                        host: str = "localhost", port: int = 5432) -> Database:
+        settings = ConnectionSettings(user=username, password=password, host=host, port=port)
+        with closing(settings.connect()) as conn:
             conn.autocommit = True
             with conn.cursor() as cursor:
-                cursor.execute(sql.SQL("CREATE DATABASE {}").format(
-                    sql.Identifier(db_name))
-                )
+                cursor.execute(QueryBuilder.create_database_query(db_name))
         database = Database(
             user=User(username=username, password=password),
-            db_name=db_name
+            db_name=db_name,
+            host=host,
+            port=port
         )
         return database
 
@@ -340,7 +725,7 @@ class LogInDatabase:
         db_name = self.database_input.get()
 
         database = Database(user=User(username=username, password=password), db_name=db_name)
-        if database.connection:
+        if database.pool:
             self.destroy()
             DatabaseWindow(database=database)
         else:
@@ -483,6 +868,10 @@ class DatabaseWindow:
         to_start_btn = tk.Button(self.window, text="Создать таблицу", font=("Arial", 16, "bold"),
                                  command=self.create_table)
         to_start_btn.pack(fill=tk.X, side=tk.BOTTOM)
+
+        cleanup_btn = tk.Button(self.window, text="Удалить брошенные промежуточные таблицы",
+                                font=("Arial", 16, "bold"), command=self.drop_stale_staging)
+        cleanup_btn.pack(fill=tk.X, side=tk.BOTTOM)
         self.window.mainloop()
 
     def destroy(self):
@@ -494,12 +883,21 @@ class DatabaseWindow:
 
     def to_start(self):
         self.destroy()
+        self.database.close()
         StartWindow()
 
     def create_table(self):
         self.destroy()
         CreateTableConfigurationWindow(self.database)
 
+    def drop_stale_staging(self):
+        try:
+            dropped = self.database.drop_stale_staging()
+        except psycopg2.Error as err:
+            mb.showerror("Ошибка", "Не удалось найти промежуточные таблицы: {}".format(err))
+            return
+        mb.showinfo("Информация", "Удалено промежуточных таблиц: {}".format(len(dropped)))
+
 
 class TableDataWindow:
     def __init__(self, database: Database, table_name: str,
@@ -508,13 +906,12 @@ class TableDataWindow:
                  minwidth=800, minheight=600
                  ):
         self.window = Tk()
+        self.tasks = TaskExecutor(self.window)
         self.database = database
-        print(database.connection)
         self.table_name = table_name
         self.table = database.get_table(self.table_name)
-        self.data = self.table.get_data()
-        self.rows_count = self.table.get_rows_count()
-        print(self.table.columns)
+        self.rows_count = 0
+        self.chart_task = None
         self.window.title(database.db_name + ": " + table_name + "(view)")
         self.window.geometry("{}x{}".format(width, height))
         self.window.state('zoomed')
@@ -525,14 +922,10 @@ class TableDataWindow:
         canvas.pack(side="top", fill="both", expand=True)
         canvas.create_window((0, 0), window=frame, anchor=tk.CENTER)
 
-        tree = Treeview(frame, columns=self.table.columns, show="headings")
-        tree.pack(fill=tk.X, expand=1)
-
-        for column in self.table.columns:
-            tree.heading(column, text=column, anchor=tk.W)
-
-        for row in self.data:
-            tree.insert("", tk.END, values=row)
+        self.tree = VirtualTreeview(frame, self.table.columns, self.table.get_page, self.rows_count,
+                                    page_size=DEFAULT_PAGE_SIZE, seek=self.table.seek,
+                                    tasks=self.tasks, on_error=self.show_task_error)
+        self.tree.pack(fill=tk.X, expand=1)
 
         canvas.update_idletasks()
         canvas.configure(scrollregion=canvas.bbox("all"))
@@ -549,27 +942,40 @@ class TableDataWindow:
                                  command=self.add_data_to_table, font=("Arial", 16, "bold"))
         add_data_btn.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
 
-        add_data_btn = tk.Button(canvas, text="Построить график",
-                                 command=self.get_chart, font=("Arial", 16, "bold"))
-        add_data_btn.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
+        self.chart_btn = tk.Button(canvas, text="Построить график",
+                                   command=self.get_chart, font=("Arial", 16, "bold"))
+        self.chart_btn.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
 
-        get_data_timedelta_label = tk.Label(canvas,
-                                            text="Время получения данных: " + str(self.table.get_data_timedelta),
-                                            font=("Arial", 16, "bold")
-                                            )
-        get_data_timedelta_label.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
+        self.get_data_timedelta_label = tk.Label(canvas,
+                                                 text="Время получения данных: " + str(self.table.timings["read"]),
+                                                 font=("Arial", 16, "bold")
+                                                 )
+        self.get_data_timedelta_label.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
 
-        data_rows_count_label = tk.Label(canvas,
-                                         text="Кол-во записей: " + str(len(self.data)),
-                                         font=("Arial", 16, "bold")
-                                         )
-        data_rows_count_label.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
+        self.data_rows_count_label = tk.Label(canvas,
+                                              text="Кол-во записей: -",
+                                              font=("Arial", 16, "bold")
+                                              )
+        self.data_rows_count_label.pack(side="bottom", ipadx=70, ipady=10, fill=tk.X)
 
+        self.tasks.submit(lambda task: self.table.get_rows_count(exact=False),
+                          on_done=self.show_rows_count, on_error=self.show_task_error)
         self.window.mainloop()
 
     def destroy(self):
+        self.tasks.shutdown()
         self.window.destroy()
 
+    def show_rows_count(self, rows_count: int):
+        self.rows_count = rows_count
+        self.tree.rows_count = max(self.tree.rows_count, rows_count)
+        self.tree.render()
+        self.data_rows_count_label.configure(text="Кол-во записей: " + str(rows_count))
+
+    def show_task_error(self, error: Exception):
+        logger.error("Task failed: %s", error)
+        self.show_error(str(error))
+
     @classmethod
     def show_info(cls, message: str):
         mb.showinfo("Информация", message)
@@ -587,17 +993,40 @@ class TableDataWindow:
         return [i * counter for i in range(1, 11)]
 
     def get_chart(self):
+        if self.chart_task is not None and not self.chart_task.done():
+            self.chart_task.cancel()
+            self.chart_btn.configure(text="Построить график")
+            return
         counts = self.get_counts_for_chart()
-        times = [self.table.get_query_time(count) for count in counts]
-        print(counts)
-        print(times)
-        build_chart(counts, times, "Rows count", "Query Time", self.table.name)
+        self.chart_btn.configure(text="Отменить построение графика")
+        self.chart_task = self.tasks.submit(self.run_chart_benchmark, counts,
+                                            on_done=self.show_chart,
+                                            on_error=self.show_task_error,
+                                            on_progress=self.show_chart_progress)
+
+    def run_chart_benchmark(self, task: Task, counts: List[int]) -> list:
+        benchmark = Benchmark(self.database, self.table_name)
+        results = []
+        for i, count in enumerate(counts, start=1):
+            results.extend(benchmark.limit_sweep([count]))
+            task.report(i, len(counts))
+        return results
+
+    def show_chart_progress(self, done: int, total: int):
+        self.chart_btn.configure(text="Отменить построение графика ({}/{})".format(done, total))
+
+    def show_chart(self, results: list):
+        self.chart_btn.configure(text="Построить график")
+        for result in results:
+            logger.info("LIMIT %s: %s", result.parameter, result.stats_ms())
+        plot_results(results, "limit_sweep", self.table.name)
 
     def save_table(self):
-        file_name = asksaveasfilename(defaultextension=".txt")
+        file_name = asksaveasfilename(defaultextension=".txt", filetypes=EXPORT_FILE_TYPES)
         if file_name:
-            self.table.record_data(file_name)
-            self.show_info("Таблица успешно сохранена.")
+            self.tasks.submit(lambda task: self.table.record_data(file_name),
+                              on_done=lambda rows_count: self.show_info("Таблица успешно сохранена."),
+                              on_error=self.show_task_error)
         else:
             self.show_error("Необходимо выбрать файл!")
 
@@ -623,6 +1052,13 @@ class ColumnElement:
         "Дата/время"
     ]
 
+    INDEX_TYPES = {
+        "Без индекса": None,
+        "Индекс B-tree": "btree",
+        "Индекс Hash": "hash",
+        "Индекс BRIN": "brin"
+    }
+
     ALLOWED_SYMBOLS = "abcdefghijklmnopqrstuvwxyz_0123456789"
 
     def __init__(self, container: tk.Frame):
@@ -635,6 +1071,10 @@ class ColumnElement:
                                   values=self.COLUMN_TYPES_RUS,
                                   state="readonly")
         self.types.current(0)
+        self.index_types = ttk.Combobox(self.frame,
+                                        values=list(self.INDEX_TYPES),
+                                        state="readonly")
+        self.index_types.current(0)
         self.is_unique_var = tk.IntVar()
         self.is_null_var = tk.IntVar(value=1)
         self.is_unique = tk.Checkbutton(self.frame, text="Уникальное значение", variable=self.is_unique_var)
@@ -644,11 +1084,13 @@ class ColumnElement:
         self.frame.pack(fill=tk.X, anchor="se", ipady=10)
         self.entry.pack(fill=tk.X, padx=10, pady=5, ipady=3, anchor="center")
         self.types.pack(fill=tk.X, padx=10, pady=5, ipady=3, anchor="center")
+        self.index_types.pack(fill=tk.X, padx=10, pady=5, ipady=3, anchor="center")
         self.is_unique.pack(fill=tk.X, padx=10, pady=5, ipady=3, anchor="center")
         self.is_null.pack(fill=tk.X, padx=10, pady=5, ipady=3, anchor="center")
 
     def destroy(self):
         self.types.destroy()
+        self.index_types.destroy()
         self.entry.destroy()
         self.is_unique.destroy()
         self.frame.destroy()
@@ -658,7 +1100,8 @@ class ColumnElement:
             "name": self.entry.get(),
             "is_unique": bool(self.is_unique_var.get()),
             "type": self.COLUMN_TYPES[self.types.get()],
-            "null": bool(self.is_null_var.get())
+            "null": bool(self.is_null_var.get()),
+            "index": self.INDEX_TYPES[self.index_types.get()]
         }
 
     def name_validate(self) -> bool:
@@ -716,6 +1159,25 @@ class CreateTableConfigurationWindow:
         self.name_entry_label.pack(fill=tk.X, side=tk.TOP)
         self.name_entry.pack(fill=tk.X, side=tk.TOP)
 
+        self.indexes_entry_label = tk.Label(self.right_frame, font=("Arial", 12, "bold"),
+                                            text="Составные индексы\n(a,b; c,d)")
+        self.indexes_entry = tk.Entry(self.right_frame, font=("Arial", 12, "bold"))
+
+        self.indexes_entry_label.pack(fill=tk.X, side=tk.TOP)
+        self.indexes_entry.pack(fill=tk.X, side=tk.TOP)
+
+        self.partition_entry_label = tk.Label(self.right_frame, font=("Arial", 12, "bold"),
+                                              text="Секционирование по столбцу")
+        self.partition_entry = tk.Entry(self.right_frame, font=("Arial", 12, "bold"))
+        self.partition_interval_label = tk.Label(self.right_frame, font=("Arial", 12, "bold"),
+                                                 text="Интервал секции\n(day/week/month/year или шаг)")
+        self.partition_interval_entry = tk.Entry(self.right_frame, font=("Arial", 12, "bold"))
+
+        self.partition_entry_label.pack(fill=tk.X, side=tk.TOP)
+        self.partition_entry.pack(fill=tk.X, side=tk.TOP)
+        self.partition_interval_label.pack(fill=tk.X, side=tk.TOP)
+        self.partition_interval_entry.pack(fill=tk.X, side=tk.TOP)
+
         self.add_column_btn = tk.Button(self.right_frame, text="Добавить столбец", font=("Arial", 16, "bold"),
                                         command=self.add_column)
 
@@ -815,26 +1277,87 @@ class CreateTableConfigurationWindow:
                 self.show_error("Уникальное значение не может быть пустым ({})".format(column["name"]))
                 return
 
+        indexes = self.get_indexes(columns_info)
+        if indexes is None:
+            return
+        partitioning = self.get_partitioning(table_name, columns_info)
+        if partitioning is False:
+            return
+
         self.destroy()
-        CreateTableDataWindow(table_name, self.database, columns_info)
+        CreateTableDataWindow(table_name, self.database, columns_info, indexes=indexes, partitioning=partitioning)
+
+    def get_partitioning(self, table_name: str, columns_info: List[dict]):
+        column_name = self.partition_entry.get().strip()
+        if not column_name:
+            return None
+        column = next((column for column in columns_info if column["name"] == column_name), None)
+        if column is None:
+            self.show_error("Столбец секционирования {} не найден".format(column_name))
+            return False
+        interval = self.partition_interval_entry.get().strip()
+        try:
+            RangePartitioning(table_name, column_name, column["type"], interval)
+        except Exception as _ex:
+            self.show_error("Недопустимое секционирование: {}".format(_ex))
+            return False
+        if any(item["is_unique"] and item["name"] != column_name for item in columns_info):
+            self.show_error("Уникальным может быть только столбец секционирования")
+            return False
+        return {"column": column_name, "interval": interval}
+
+    def get_indexes(self, columns_info: List[dict]):
+        specs = [
+            ((column["name"],), column["index"])
+            for column in columns_info if column["index"] and not column["is_unique"]
+        ]
+        names = [column["name"] for column in columns_info]
+        for group in self.indexes_entry.get().split(";"):
+            columns = [name.strip() for name in group.split(",") if name.strip()]
+            if not columns:
+                continue
+            unknown = [name for name in columns if name not in names]
+            if unknown:
+                self.show_error("Неизвестные столбцы в составном индексе: {}".format(", ".join(unknown)))
+                return None
+            specs.append((tuple(columns), "btree"))
+        # Repeated specs would get the same index name, primary keys already have their B-tree
+        seen = {((column["name"],), "btree") for column in columns_info if column["is_unique"]}
+        indexes = []
+        for columns, method in specs:
+            if (columns, method) not in seen:
+                seen.add((columns, method))
+                indexes.append({"columns": list(columns), "method": method})
+        return indexes
 
 
 class CreateTableDataWindow:
     def __init__(self, table_name: str,
                  database: Database,
                  table_conf=None,
+                 indexes: List[dict] = None,
+                 partitioning: dict = None,
                  types_list: List[str] = None,
                  create_table=True,
-                 width=400, height=400,
-                 maxwidth=400, maxheight=400,
-                 minwidth=400, minheight=400):
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 load_workers: int = DEFAULT_LOAD_WORKERS,
+                 width=400, height=490,
+                 maxwidth=400, maxheight=490,
+                 minwidth=400, minheight=490):
         self.window = Tk()
+        self.tasks = TaskExecutor(self.window)
+        self.save_task = None
         self.database = database
         self.table_name = table_name
         self.table_conf = table_conf
+        self.indexes = indexes or []
+        self.partitioning = partitioning
         self.create_table = create_table
         self.types_list = types_list
-        self.insert_data = []
+        self.pool_size = pool_size
+        # Pooled connections stay free for the staging DDL and final INSERT ... SELECT, and for the staging locks
+        self.load_workers = max(1, min(load_workers, self.database.pool.max_size - 2))
+        self.import_pipeline = None
         self.import_status = False
         self.window.title("Создание таблицы в БД: " + str(self.database.db_name) + ": Импорт данных")
         self.window.geometry("{}x{}".format(width, height))
@@ -857,6 +1380,15 @@ class CreateTableDataWindow:
                                         font=("Arial", 16, "bold"), command=self.save_table, state="disabled")
         self.table_save_btn.pack(fill=tk.X, ipady=10, padx=10)
 
+        self.cancel_btn = tk.Button(self.window, border=5, text="Отменить загрузку",
+                                    font=("Arial", 12, "bold"), command=self.cancel_save, state="disabled")
+        self.cancel_btn.pack(fill=tk.X, padx=10)
+
+        self.resumable_var = tk.IntVar(master=self.window)
+        self.resumable_check = tk.Checkbutton(self.window, text="Возобновляемая загрузка (фиксация по пакетам)",
+                                              variable=self.resumable_var)
+        self.resumable_check.pack(fill=tk.X, padx=10)
+
         self.import_info_label = tk.Label(self.window, text="Информация по импорту",
                                           font=("Arial", 12, "bold"))
         self.import_info_label.pack(fill=tk.X)
@@ -880,6 +1412,7 @@ class CreateTableDataWindow:
         self.window.mainloop()
 
     def destroy(self):
+        self.tasks.shutdown()
         self.window.destroy()
 
     @classmethod
@@ -893,82 +1426,175 @@ class CreateTableDataWindow:
     def get_types_list(self) -> List[str]:
         return [column.get("type") for column in self.table_conf]
 
+    def get_columns_list(self) -> List[str]:
+        if self.create_table:
+            return [column.get("name") for column in self.table_conf]
+        return self.database.get_table(self.table_name).columns
+
     @staticmethod
     def types_parse(types: List[str], data: List[str]) -> list:
-        if len(types) != len(data):
-            raise Exception("Incorrect data")
-        parsed_data = []
-        for i in range(len(data)):
-            if types[i] == "int":
-                try:
-                    parsed_data.append(int(data[i]))
-                except Exception as _ex:
-                    raise _ex
-            elif types[i] == "float":
-                try:
-                    parsed_data.append(float(data[i]))
-                except Exception as _ex:
-                    raise _ex
-            elif types[i] == "text":
-                try:
-                    parsed_data.append(str(data[i]))
-                except Exception as _ex:
-                    raise _ex
-            elif types[i] == "timestamp":
-                try:
-                    parsed_data.append(datetime.strptime(data[i], "%Y-%m-%d %H:%M:%S.%f"))
-                except Exception as _ex:
-                    raise _ex
-        return parsed_data
+        return types_parse(types, data)
 
     @staticmethod
     def open_file(filepath: str, types: list[str]):
-        data = []
+        typed_data = []
         if filepath != "":
-            with open(filepath, "r", encoding="utf-8") as file:
-
-                for line in file:
-                    data.append(line.split("\t"))
-
-        typed_data = [CreateTableDataWindow.types_parse(types, item) for item in data]
+            for chunk in ImportPipeline(filepath, types).chunks():
+                typed_data.extend(chunk)
         return typed_data
 
     def get_insert_data(self):
-        filepath = askopenfilename(filetypes=(('text files', 'txt'),))
-        preapared_data = []
+        filepath = askopenfilename(filetypes=IMPORT_FILE_TYPES)
         types = self.get_types_list() if self.create_table else self.types_list
-        line_counter = 0
-        pool = mp.Pool(5)
-        jobs = []
         try:
-            typed_data = self.open_file(filepath, types)
+            if detect_columnar_format(filepath):
+                pipeline = ColumnarImportPipeline(filepath, self.get_columns_list(), types)
+                pipeline.preview()
+                rows_count = pipeline.count_rows()
+            else:
+                pipeline = ParallelImportPipeline(filepath, types, pool_size=self.pool_size)
+                pipeline.preview()
+                rows_count = count_lines(filepath)
 
             self.import_status_label.configure(text="Статус импорта: Успех")
             self.import_status = True
             self.table_save_btn.configure(state="normal")
-            self.insert_data = typed_data
-            self.import_info_data_count_label.configure(text="Количество строк: " + str(len(self.insert_data)))
+            self.import_pipeline = pipeline
+            self.import_info_data_count_label.configure(text="Количество строк: " + str(rows_count))
         except Exception as _ex:
-            print(_ex)
-            self.show_error("Невозможно прочитать файл!")
+            logger.error("Cannot read %s: %s", filepath, _ex)
+            self.show_error("Невозможно прочитать файл!\n" + str(_ex))
             self.import_status_label.configure(text="Статус импорта: Ошибка")
             self.import_status = False
             self.table_save_btn.configure(state="disabled")
 
+    def show_import_progress(self, rows_count: int, bytes_read: int, total_bytes: int):
+        percent = round(bytes_read / total_bytes * 100) if total_bytes else 100
+        self.import_status_label.configure(text="Загружено строк: {} ({}%)".format(rows_count, percent))
+
     def save_table(self):
-        table = Table.create_in_db(self.table_name, self.table_conf, self.database) \
+        if self.resumable_var.get() and not self.prepare_resume():
+            return
+        self.table_save_btn.configure(state="disabled")
+        self.import_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="normal")
+        self.save_task = self.tasks.submit(self.load_table_resumable if self.resumable_var.get() else self.load_table,
+                                           on_done=self.show_load_result,
+                                           on_error=self.show_load_error,
+                                           on_progress=self.show_import_progress,
+                                           on_cancelled=self.show_load_cancelled)
+
+    def load_table(self, task: Task) -> Table:
+        if self.create_table and not self.partitioning:
+            return self.load_table_staged(task)
+        table = Table.create_in_db(self.table_name, self.table_conf, self.database, self.partitioning) \
             if self.create_table else self.database.get_table(self.table_name)
-        insert_status = table.insert_data(self.insert_data)
-        if insert_status:
-            self.move_to_table_btn.configure(state="normal")
-            self.import_info_data_prepare_label.configure(text="Подготовка данных \nдля запроса: " +
-                                                               str(table.data_prepare_timedelta) + " секунд")
-            self.import_info_data_insert_label.configure(text="Время выполнения запроса: " +
-                                                              str(table.data_insert_timedelta) + " секунд")
-        else:
+        insert_status = self.import_pipeline.run(table, progress=task.report, workers=self.load_workers)
+        if not insert_status:
             if self.create_table:
                 table.delete_from_db()
-            self.show_error("Ошибка")
+            task.check()
+            raise Exception("Ошибка")
+        if self.create_table:
+            table.create_indexes(self.indexes)
+        table.analyze()
+        return table
+
+    def load_table_staged(self, task: Task) -> Table:
+        # Rows go into an UNLOGGED table under a temporary name, the real name only appears once it is complete
+        name = staging_name(self.table_name)
+        with self.database.hold_staging([name]):
+            staging = Table.create_in_db(name, self.table_conf, self.database, unlogged=True)
+            try:
+                insert_status = self.import_pipeline.run(staging, progress=task.report,
+                                                         workers=self.load_workers, staging=False)
+                if not insert_status:
+                    task.check()
+                    raise Exception("Ошибка")
+                table = staging.swap_into(self.table_name)
+            except BaseException:
+                staging.delete_from_db()
+                raise
+        table.create_indexes(self.indexes)
+        table.analyze()
+        return table
+
+    def prepare_resume(self) -> bool:
+        store = CheckpointStore(self.database.connection)
+        try:
+            checkpoint = store.load(self.table_name, self.import_pipeline.source)
+        except psycopg2.Error as _ex:
+            # Checkpoints need CREATE on the database for their schema, without it the file loads in one go
+            logger.warning("Resumable import is unavailable: %s", _ex)
+            self.resumable_var.set(0)
+            self.resumable_check.configure(state="disabled")
+            self.show_error("Возобновляемая загрузка недоступна, файл будет загружен целиком.\n" + str(_ex))
+            return True
+        if checkpoint is None:
+            return True
+        answer = mb.askyesnocancel("Возобновление загрузки",
+                                   "Загрузка этого файла была прервана после {} строк.\n"
+                                   "Продолжить с места остановки?".format(checkpoint.rows_count))
+        if answer is None:
+            return False
+        if not answer:
+            if not self.create_table and not mb.askokcancel(
+                    "Загрузка заново",
+                    "Уже загруженные {} строк останутся в таблице и будут добавлены повторно.\n"
+                    "Начать загрузку заново?".format(checkpoint.rows_count)):
+                return False
+            # Starting over: forget the checkpoint; a table this window created is dropped with its rows,
+            # an existing table keeps the rows the interrupted run committed
+            store.clear(self.table_name, self.import_pipeline.source)
+            self.database.refresh_info(reload=True)
+            if self.create_table and self.table_name in self.database.tables:
+                self.database.get_table(self.table_name).delete_from_db()
+        return True
+
+    def load_table_resumable(self, task: Task) -> Table:
+        # The table and its committed batches are kept on failure, saving again resumes the load
+        self.database.refresh_info(reload=True)
+        if self.create_table and self.table_name not in self.database.tables:
+            # A checkpoint without its table is stale
+            CheckpointStore(self.database.connection).clear(self.table_name, self.import_pipeline.source)
+            table = Table.create_in_db(self.table_name, self.table_conf, self.database, self.partitioning)
+        else:
+            table = self.database.get_table(self.table_name)
+        table.insert_resumable(self.import_pipeline, progress=task.report)
+        if self.create_table:
+            table.create_indexes(self.indexes)
+        table.analyze()
+        return table
+
+    def cancel_save(self):
+        # Saving stays disabled until the worker has stopped and cleaned up, see show_load_cancelled
+        if self.save_task is not None:
+            self.save_task.cancel()
+        self.cancel_btn.configure(state="disabled")
+        self.import_status_label.configure(text="Статус импорта: Отмена...")
+
+    def show_load_cancelled(self):
+        self.import_btn.configure(state="normal")
+        self.table_save_btn.configure(state="normal")
+        self.import_status_label.configure(text="Статус импорта: Отменено")
+
+    def show_load_result(self, table: Table):
+        self.cancel_btn.configure(state="disabled")
+        self.move_to_table_btn.configure(state="normal")
+        self.import_info_data_prepare_label.configure(text="Подготовка данных \nдля запроса: " +
+                                                           str(table.timings["encode"]) + " секунд")
+        self.import_info_data_insert_label.configure(text="Время выполнения запроса: " +
+                                                          str(table.timings["copy"]) + " секунд")
+        if table.index_errors:
+            mb.showwarning("Индексы", "Таблица загружена, но не удалось построить индексы:\n" +
+                           "\n".join(table.index_errors))
+
+    def show_load_error(self, error: Exception):
+        logger.error("Import failed: %s", error)
+        self.cancel_btn.configure(state="disabled")
+        self.import_btn.configure(state="normal")
+        self.table_save_btn.configure(state="normal")
+        self.show_error(str(error))
 
     def move_to_table(self):
         self.destroy()
@@ -976,6 +1602,7 @@ class CreateTableDataWindow:
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     app = StartWindow()
 
 
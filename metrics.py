@@ -0,0 +1,196 @@
+import json
+import logging
+import re
+import threading
+from functools import wraps
+from time import perf_counter_ns
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFIX = "dbtool"
+
+
+class Span:
+    def __init__(self, registry: "MetricsRegistry", name: str, **labels):
+        self.registry = registry
+        self.name = name
+        self.labels = {key: str(value) for key, value in labels.items()}
+        self.elapsed_ns = 0
+        self.rows = 0
+        self.bytes = 0
+        self.finished = False
+        self._started_ns = None
+
+    @property
+    def seconds(self) -> float:
+        return self.elapsed_ns / 1e9
+
+    def start(self) -> "Span":
+        if self._started_ns is None:
+            self._started_ns = perf_counter_ns()
+        return self
+
+    def stop(self) -> "Span":
+        if self._started_ns is not None:
+            self.elapsed_ns += perf_counter_ns() - self._started_ns
+            self._started_ns = None
+        return self
+
+    def add(self, rows: int = 0, bytes: int = 0):
+        self.rows += rows
+        self.bytes += bytes
+
+    def paused(self) -> "_Paused":
+        # Time spent outside the operation, e.g. while a generator is suspended at yield
+        return _Paused(self)
+
+    def finish(self, failed: bool = False):
+        self.stop()
+        if not self.finished:
+            self.finished = True
+            self.registry.record(self, failed)
+
+    def __enter__(self) -> "Span":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.finish(failed=exc_type is not None and not issubclass(exc_type, GeneratorExit))
+        return False
+
+
+class _Paused:
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self):
+        self.span.stop()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.span.start()
+        return False
+
+
+class MetricSeries:
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.last_ns = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def observe(self, span: Span, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total_ns += span.elapsed_ns
+        self.min_ns = span.elapsed_ns if self.min_ns is None else min(self.min_ns, span.elapsed_ns)
+        self.max_ns = max(self.max_ns, span.elapsed_ns)
+        self.last_ns = span.elapsed_ns
+        self.rows += span.rows
+        self.bytes += span.bytes
+
+    def as_dict(self) -> dict:
+        seconds = self.total_ns / 1e9
+        return {
+            "name": self.name,
+            "labels": dict(self.labels),
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": seconds,
+            "min_seconds": (self.min_ns or 0) / 1e9,
+            "max_seconds": self.max_ns / 1e9,
+            "last_seconds": self.last_ns / 1e9,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rows_per_second": self.rows / seconds if seconds else 0.0,
+            "bytes_per_second": self.bytes / seconds if seconds else 0.0,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._series: Dict[tuple, MetricSeries] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **labels) -> Span:
+        return Span(self, name, **labels)
+
+    def record(self, span: Span, failed: bool = False):
+        key = (span.name, tuple(sorted(span.labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = MetricSeries(span.name, dict(key[1]))
+            series.observe(span, failed)
+        logger.debug("%s %s %.3f ms rows=%d bytes=%d%s", span.name, span.labels,
+                     span.elapsed_ns / 1e6, span.rows, span.bytes, " failed" if failed else "")
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [series.as_dict() for series in self._series.values()]
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps({"metrics": self.snapshot()}, indent=indent)
+
+    def to_prometheus(self, prefix: str = DEFAULT_PREFIX) -> str:
+        families = {}
+        for series in self.snapshot():
+            families.setdefault(metric_name(prefix, series["name"]), []).append(series)
+        lines = []
+        for name, items in sorted(families.items()):
+            lines.append(f"# TYPE {name}_seconds summary")
+            for series in items:
+                labels = prometheus_labels(series["labels"])
+                lines.append(f"{name}_seconds_sum{labels} {series['total_seconds']!r}")
+                lines.append(f"{name}_seconds_count{labels} {series['count']}")
+            for suffix, field in (("errors_total", "errors"), ("rows_total", "rows"), ("bytes_total", "bytes")):
+                lines.append(f"# TYPE {name}_{suffix} counter")
+                for series in items:
+                    lines.append(f"{name}_{suffix}{prometheus_labels(series['labels'])} {series[field]}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, file_name: str):
+        # "*.prom" and "*.txt" get the Prometheus text format, anything else JSON
+        text = self.to_prometheus() if file_name.endswith((".prom", ".txt")) else self.to_json()
+        with open(file_name, "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+def metric_name(prefix: str, name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}" if prefix else name)
+
+
+def prometheus_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for key, value in sorted(labels.items())
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def timed(name: str, **labels) -> Span:
+    return REGISTRY.span(name, **labels)
+
+
+def instrumented(name: str) -> Callable:
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,137 @@
+import asyncio
+from itertools import count
+from typing import AsyncIterator, Dict, Iterable, List
+
+from postgres.catalog import CATALOG_QUERY, ESTIMATE_QUERY, TableInfo, pick_estimate, tables_from_rows
+from postgres.copy_loader import DEFAULT_BATCH_SIZE, batched
+from postgres.pool import ConnectionSettings
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+
+DEFAULT_ITERSIZE = 2000
+
+
+def require_psycopg():
+    if psycopg is None:
+        raise Exception("The asyncio layer requires the 'psycopg' and 'psycopg_pool' packages")
+
+
+class AsyncDatabase:
+    def __init__(self, settings: ConnectionSettings,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 max_idle: float = 300.0):
+        require_psycopg()
+        self.settings = settings
+        self.db_name = settings.database
+        kwargs = settings.connect_kwargs()
+        if "database" in kwargs:
+            kwargs["dbname"] = kwargs.pop("database")
+        self.pool = AsyncConnectionPool(make_conninfo(**kwargs),
+                                        min_size=min_size, max_size=max_size,
+                                        max_idle=max_idle, open=False)
+        self._tables = None
+
+    async def open(self):
+        await self.pool.open(wait=True)
+        return self
+
+    async def close(self):
+        await self.pool.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    def connection(self):
+        return self.pool.connection()
+
+    async def load_catalog(self) -> Dict[str, TableInfo]:
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(CATALOG_QUERY, ("public",))
+                self._tables = tables_from_rows(await cursor.fetchall())
+        return self._tables
+
+    async def get_tables(self) -> List[str]:
+        if self._tables is None:
+            await self.load_catalog()
+        return [name for name, info in self._tables.items() if not info.staging]
+
+    async def get_table(self, table_name: str) -> "AsyncTable":
+        if self._tables is None or table_name not in self._tables:
+            await self.load_catalog()
+        return AsyncTable(self, self._tables[table_name])
+
+    def invalidate(self):
+        self._tables = None
+
+    async def gather(self, *coroutines):
+        # Each coroutine checks out its own pooled connection, so they run concurrently
+        return await asyncio.gather(*coroutines)
+
+
+class AsyncTable:
+    _cursor_counter = count()
+
+    def __init__(self, database: AsyncDatabase, info: TableInfo):
+        self.database = database
+        self.name = info.name
+        self.columns = info.column_names
+        self.columns_types = info.column_types
+
+    def _select(self, limit: int = None):
+        query = sql.SQL("SELECT * FROM {}").format(sql.Identifier(self.name))
+        if limit is not None:
+            query += sql.SQL(" LIMIT %s")
+        return query
+
+    async def get_data(self, limit: int = None) -> list:
+        async with self.database.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(self._select(limit), (limit,) if limit is not None else None)
+                return await cursor.fetchall()
+
+    async def iter_data(self, itersize: int = DEFAULT_ITERSIZE) -> AsyncIterator[list]:
+        cursor_name = "{}_async_stream_{}".format(self.name, next(self._cursor_counter))
+        async with self.database.connection() as conn:
+            async with conn.cursor(name=cursor_name) as cursor:
+                cursor.itersize = itersize
+                await cursor.execute(self._select())
+                while rows := await cursor.fetchmany(itersize):
+                    yield rows
+
+    async def get_rows_count(self, exact: bool = True) -> int:
+        async with self.database.connection() as conn:
+            async with conn.cursor() as cursor:
+                if not exact:
+                    # Same rule as Table.estimate_rows_count
+                    await cursor.execute(ESTIMATE_QUERY, (self.name,))
+                    estimate = pick_estimate(*await cursor.fetchone())
+                    if estimate is not None:
+                        return estimate
+                await cursor.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(self.name)))
+                return (await cursor.fetchone())[0]
+
+    async def insert_data(self, data: Iterable[list], batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+        query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(self.name),
+            sql.SQL(", ").join(sql.Identifier(column) for column in self.columns)
+        )
+        rows_count = 0
+        async with self.database.connection() as conn:
+            async with conn.cursor() as cursor:
+                async with cursor.copy(query) as copy:
+                    for batch in batched(data, batch_size):
+                        for row in batch:
+                            await copy.write_row(row)
+                        rows_count += len(batch)
+        return rows_count
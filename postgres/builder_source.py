@@ -12,3 +12,14 @@ TABLE_SCHEMA = "table_schema"
 TABLES = "tables"
 COLUMNS = "columns"
 SCHEMA = "information_schema"
+ORDER_BY = "ORDER BY"
+DESC = "DESC"
+EQUAL = "="
+NOT_EQUAL = "<>"
+LESS = "<"
+LESS_EQUAL = "<="
+GREATER = ">"
+GREATER_EQUAL = ">="
+LIKE = "LIKE"
+ILIKE = "ILIKE"
+IN = "IN"
@@ -0,0 +1,140 @@
+import re
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from postgres.staging import STAGING_PATTERN
+
+CATALOG_QUERY = (
+    "SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), a.attnum, "
+    "a.attnotnull, COALESCE(i.indisprimary, false), c.relkind, obj_description(c.oid, 'pg_class'), "
+    "c.relpersistence "
+    "FROM pg_catalog.pg_class c "
+    "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+    "LEFT JOIN pg_catalog.pg_attribute a "
+    "ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped "
+    "LEFT JOIN pg_catalog.pg_index i "
+    "ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey) "
+    "WHERE n.nspname = %s AND c.relkind IN ('r', 'p', 'v', 'm', 'f') "
+    # Partitions are reached through their parent table
+    "AND NOT c.relispartition "
+    "ORDER BY c.relname, a.attnum"
+)
+
+ESTIMATE_QUERY = (
+    "SELECT c.reltuples::bigint, s.n_live_tup FROM pg_class c "
+    "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+    "WHERE c.oid = %s::regclass"
+)
+
+# Leaf heaps in tableoid order: the table itself, or the partitions of a partitioned table
+HEAPS_QUERY = (
+    "SELECT c.oid, c.relname, pg_relation_size(c.oid) / current_setting('block_size')::int, c.reltuples "
+    "FROM pg_partition_tree(%s::regclass) t "
+    "JOIN pg_catalog.pg_class c ON c.oid = t.relid "
+    "WHERE t.isleaf AND c.relkind = 'r' "
+    "ORDER BY c.oid"
+)
+
+# The histogram bound below the given fraction of the column's values, as text
+KEY_BOUND_QUERY = (
+    "SELECT b[GREATEST(1, CEIL(%s * array_length(b, 1)))::int] FROM ("
+    "SELECT histogram_bounds::text::text[] AS b FROM pg_catalog.pg_stats "
+    "WHERE schemaname = current_schema() AND tablename = %s AND attname = %s "
+    "ORDER BY inherited DESC LIMIT 1) s"
+)
+
+TYPE_NAMES = {
+    "integer": "int",
+    "double precision": "float",
+}
+
+
+def pick_estimate(reltuples: Optional[int], live_tuples: Optional[int]) -> Optional[int]:
+    # reltuples is -1 (or 0) until the table has been vacuumed or analyzed,
+    # None means only an exact COUNT(*) can tell
+    if reltuples and reltuples > 0:
+        return reltuples
+    if live_tuples:
+        return live_tuples
+    return None
+
+
+class ColumnInfo:
+    def __init__(self, name: str, column_type: str, position: int,
+                 not_null: bool, primary: bool):
+        self.name = name
+        self.type = column_type
+        self.position = position
+        self.not_null = not_null
+        self.primary = primary
+
+
+class TableInfo:
+    def __init__(self, name: str, kind: str = "r", comment: str = None, persistence: str = "p"):
+        self.name = name
+        self.kind = kind
+        self.comment = comment
+        self.persistence = persistence
+        self.columns: List[ColumnInfo] = []
+
+    @property
+    def partitioned(self) -> bool:
+        return self.kind == "p"
+
+    @property
+    def staging(self) -> bool:
+        # Staging tables of running or crashed loads stay out of the table lists
+        return self.persistence == "u" and re.search(STAGING_PATTERN, self.name) is not None
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def column_types(self) -> List[str]:
+        return [TYPE_NAMES.get(column.type, column.type) for column in self.columns]
+
+    @property
+    def key_column(self):
+        keys = [column.name for column in self.columns if column.primary]
+        return keys[0] if len(keys) == 1 else None
+
+
+def tables_from_rows(rows) -> Dict[str, TableInfo]:
+    tables = {}
+    for table_name, name, column_type, position, not_null, primary, kind, comment, persistence in rows:
+        table = tables.setdefault(table_name, TableInfo(table_name, kind, comment, persistence))
+        if name is not None:
+            table.columns.append(ColumnInfo(name, column_type, position, not_null, primary))
+    return tables
+
+
+class Catalog:
+    def __init__(self, connection: Callable, schema: str = "public"):
+        self.connection = connection
+        self.schema = schema
+        self._tables = None
+        self._lock = Lock()
+
+    def load(self) -> Dict[str, TableInfo]:
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(CATALOG_QUERY, (self.schema,))
+                return tables_from_rows(cursor.fetchall())
+
+    @property
+    def tables(self) -> Dict[str, TableInfo]:
+        with self._lock:
+            if self._tables is None:
+                self._tables = self.load()
+            return self._tables
+
+    def table(self, table_name: str) -> TableInfo:
+        if table_name not in self.tables:
+            # The table may have been created by another client since the last load
+            self.invalidate()
+        return self.tables[table_name]
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
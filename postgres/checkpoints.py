@@ -0,0 +1,66 @@
+from typing import Callable, Optional
+
+from psycopg2 import sql
+
+# Outside "public", so the catalog and the table list never show it
+CHECKPOINT_SCHEMA = "dbtool"
+CHECKPOINT_TABLE = "import_checkpoints"
+
+
+class Checkpoint:
+    def __init__(self, table_name: str, source: str, file_size: int,
+                 bytes_read: int = 0, rows_count: int = 0):
+        self.table_name = table_name
+        self.source = source
+        self.file_size = file_size
+        self.bytes_read = bytes_read
+        self.rows_count = rows_count
+
+
+class CheckpointStore:
+    def __init__(self, connection: Callable):
+        self.connection = connection
+        self.table = sql.Identifier(CHECKPOINT_SCHEMA, CHECKPOINT_TABLE)
+        self._ready = False
+
+    def ensure(self):
+        if self._ready:
+            return
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(CHECKPOINT_SCHEMA)))
+                cursor.execute(sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} ("
+                    "table_name text NOT NULL, source text NOT NULL, file_size bigint NOT NULL, "
+                    "bytes_read bigint NOT NULL, rows_count bigint NOT NULL, "
+                    "updated_at timestamptz NOT NULL DEFAULT now(), "
+                    "PRIMARY KEY (table_name, source))"
+                ).format(self.table))
+        self._ready = True
+
+    def load(self, table_name: str, source: str) -> Optional[Checkpoint]:
+        self.ensure()
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL(
+                    "SELECT file_size, bytes_read, rows_count FROM {} WHERE table_name = %s AND source = %s"
+                ).format(self.table), (table_name, source))
+                row = cursor.fetchone()
+        return Checkpoint(table_name, source, *row) if row else None
+
+    def save(self, cursor, checkpoint: Checkpoint):
+        # Runs in the caller's transaction, so the checkpoint commits together with the batch
+        cursor.execute(sql.SQL(
+            "INSERT INTO {} (table_name, source, file_size, bytes_read, rows_count) VALUES (%s, %s, %s, %s, %s) "
+            "ON CONFLICT (table_name, source) DO UPDATE SET "
+            "file_size = EXCLUDED.file_size, bytes_read = EXCLUDED.bytes_read, "
+            "rows_count = EXCLUDED.rows_count, updated_at = now()"
+        ).format(self.table), (checkpoint.table_name, checkpoint.source, checkpoint.file_size,
+                               checkpoint.bytes_read, checkpoint.rows_count))
+
+    def clear(self, table_name: str, source: str):
+        self.ensure()
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("DELETE FROM {} WHERE table_name = %s AND source = %s").format(self.table),
+                               (table_name, source))
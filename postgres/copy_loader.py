@@ -0,0 +1,240 @@
+import io
+import re
+import struct
+from datetime import datetime, date, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List, Literal, Optional, Callable
+
+from psycopg2 import sql
+
+from metrics import timed
+
+
+COPY_FORMATS = Literal[
+    "text",
+    "binary",
+]
+
+DEFAULT_BATCH_SIZE = 50_000
+
+# PostgreSQL binary COPY layout: signature, flags field, header extension length
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+BINARY_TRAILER = struct.pack("!h", -1)
+PG_EPOCH = datetime(2000, 1, 1)
+PG_EPOCH_DATE = PG_EPOCH.date()
+# Catalog type name -> binary COPY layout; types without an entry are only loaded in text format
+BINARY_TYPES = {
+    "int": "int4",
+    "integer": "int4",
+    "int4": "int4",
+    "bigint": "int8",
+    "int8": "int8",
+    "smallint": "int2",
+    "int2": "int2",
+    "boolean": "bool",
+    "bool": "bool",
+    "float": "float8",
+    "double precision": "float8",
+    "float8": "float8",
+    "real": "float4",
+    "float4": "float4",
+    "timestamp": "timestamp",
+    "timestamp without time zone": "timestamp",
+    "timestamptz": "timestamp",
+    "timestamp with time zone": "timestamp",
+    "date": "date",
+    "text": "text",
+    "varchar": "text",
+    "character varying": "text",
+}
+
+TEXT_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+def batched(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def normalize_type(column_type: str) -> str:
+    if column_type.startswith("timestamp"):
+        return "timestamp"
+    if column_type in ("int", "integer", "int4"):
+        return "int"
+    if column_type in ("float", "double precision", "float8"):
+        return "float"
+    return "text"
+
+
+def binary_type(column_type: str) -> Optional[str]:
+    # "numeric(10,2)", "timestamp(3) without time zone": the modifier does not change the layout
+    return BINARY_TYPES.get(re.sub(r"\([^)]*\)", "", column_type).strip().lower())
+
+
+class CopyLoader:
+    def __init__(self, table_name: str,
+                 columns: List[str],
+                 types: List[str],
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 copy_format: COPY_FORMATS = "text"):
+        if copy_format not in ("text", "binary"):
+            raise Exception(f"Unknown COPY format: {copy_format}")
+        if batch_size <= 0:
+            raise Exception("Batch size must be positive")
+        if len(columns) != len(types):
+            raise Exception("Types count must coincide with Table Columns count")
+
+        self.table_name = table_name
+        self.columns = columns
+        self.types = [normalize_type(item) for item in types]
+        self.batch_size = batch_size
+        self._field_encoders = tuple(self._binary_encoder(item) for item in types)
+        if copy_format == "binary" and None in self._field_encoders:
+            # The server rejects a binary field it cannot read, e.g. numeric sent as text bytes
+            copy_format = "text"
+        self.copy_format = copy_format
+        self.prepare_time = 0.0
+        self.insert_time = 0.0
+        self.rows_count = 0
+        self.query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT {})").format(
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(sql.Identifier(column) for column in columns),
+            sql.SQL(copy_format),
+        )
+
+    # Text format
+
+    @staticmethod
+    def _text_value(value) -> str:
+        if value is None:
+            return "\\N"
+        if isinstance(value, (datetime, date)):
+            return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+        return str(value).translate(TEXT_ESCAPES)
+
+    def encode_text(self, rows: List[list]) -> io.BytesIO:
+        text_value = self._text_value
+        lines = ["\t".join([text_value(value) for value in row]) for row in rows]
+        lines.append("")
+        return io.BytesIO("\n".join(lines).encode("utf-8"))
+
+    # Binary format
+
+    @staticmethod
+    def _encode_int(value) -> bytes:
+        return b"\x00\x00\x00\x04" + struct.pack("!i", value)
+
+    @staticmethod
+    def _encode_bigint(value) -> bytes:
+        return b"\x00\x00\x00\x08" + struct.pack("!q", value)
+
+    @staticmethod
+    def _encode_smallint(value) -> bytes:
+        return b"\x00\x00\x00\x02" + struct.pack("!h", value)
+
+    @staticmethod
+    def _encode_bool(value) -> bytes:
+        return b"\x00\x00\x00\x01\x01" if value else b"\x00\x00\x00\x01\x00"
+
+    @staticmethod
+    def _encode_float(value) -> bytes:
+        return b"\x00\x00\x00\x08" + struct.pack("!d", value)
+
+    @staticmethod
+    def _encode_real(value) -> bytes:
+        return b"\x00\x00\x00\x04" + struct.pack("!f", value)
+
+    @staticmethod
+    def _encode_text(value) -> bytes:
+        data = str(value).encode("utf-8")
+        return struct.pack("!i", len(data)) + data
+
+    @staticmethod
+    def _encode_timestamp(value) -> bytes:
+        # Both timestamp flavours travel as microseconds since 2000-01-01, timestamptz ones in UTC
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        delta = value - PG_EPOCH
+        micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+        return b"\x00\x00\x00\x08" + struct.pack("!q", micros)
+
+    @staticmethod
+    def _encode_date(value) -> bytes:
+        if isinstance(value, datetime):
+            value = value.date()
+        return b"\x00\x00\x00\x04" + struct.pack("!i", (value - PG_EPOCH_DATE).days)
+
+    def _binary_encoder(self, column_type: str) -> Optional[Callable]:
+        return {
+            "int4": self._encode_int,
+            "int8": self._encode_bigint,
+            "int2": self._encode_smallint,
+            "bool": self._encode_bool,
+            "float8": self._encode_float,
+            "float4": self._encode_real,
+            "timestamp": self._encode_timestamp,
+            "date": self._encode_date,
+            "text": self._encode_text,
+        }.get(binary_type(column_type))
+
+    def encode_binary(self, rows: List[list]) -> io.BytesIO:
+        buffer = io.BytesIO()
+        write = buffer.write
+        encoders = self._field_encoders
+        field_count = struct.pack("!h", len(encoders))
+        null = struct.pack("!i", -1)
+        write(BINARY_HEADER)
+        for row in rows:
+            write(field_count)
+            for encoder, value in zip(encoders, row):
+                write(null if value is None else encoder(value))
+        write(BINARY_TRAILER)
+        buffer.seek(0)
+        return buffer
+
+    def encode(self, rows: List[list]) -> io.BytesIO:
+        if self.copy_format == "binary":
+            return self.encode_binary(rows)
+        return self.encode_text(rows)
+
+    # Loading
+
+    def copy_batch(self, cursor, rows: List[list]) -> int:
+        labels = {"table": self.table_name, "format": self.copy_format}
+        with timed("copy_encode", **labels) as span:
+            buffer = self.encode(rows)
+            span.add(rows=len(rows), bytes=buffer.getbuffer().nbytes)
+        self.prepare_time += span.seconds
+
+        with timed("copy_send", **labels) as span:
+            span.add(rows=len(rows), bytes=buffer.getbuffer().nbytes)
+            cursor.copy_expert(self.query, buffer)
+        self.insert_time += span.seconds
+
+        self.rows_count += len(rows)
+        return len(rows)
+
+    def load_batches(self, connection,
+                     batches: Iterable[List[list]],
+                     progress: Optional[Callable[[int], None]] = None) -> int:
+        with connection.cursor() as cursor:
+            for batch in batches:
+                if not batch:
+                    continue
+                self.copy_batch(cursor, batch)
+                if progress:
+                    progress(self.rows_count)
+        return self.rows_count
+
+    def load(self, connection, rows: Iterable[list],
+             progress: Optional[Callable[[int], None]] = None) -> int:
+        return self.load_batches(connection, batched(rows, self.batch_size), progress)
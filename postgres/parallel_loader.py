@@ -0,0 +1,151 @@
+import queue
+import threading
+from contextlib import nullcontext
+from typing import Callable, Iterable, List, Optional
+
+from psycopg2 import sql
+
+from metrics import timed
+from postgres.copy_loader import CopyLoader, COPY_FORMATS, DEFAULT_BATCH_SIZE
+from postgres.staging import staging_name
+
+DEFAULT_WORKERS = 4
+QUEUE_TIMEOUT = 0.5
+
+
+class ParallelCopyLoader:
+    # Each worker COPYs its share of the batches into its own staging table on its own
+    # connection; the target only changes in the final INSERT ... SELECT transaction.
+    # Without staging the workers copy into the target directly, for targets that are
+    # themselves staging tables nobody else can see yet.
+    def __init__(self, connection: Callable,
+                 table_name: str,
+                 columns: List[str],
+                 types: List[str],
+                 workers: int = DEFAULT_WORKERS,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 copy_format: COPY_FORMATS = "text",
+                 staging: bool = True,
+                 hold: Callable = None):
+        # hold(names) is a context manager that keeps the staging tables from being swept as stale
+        if workers < 1:
+            raise Exception("Workers count must be positive")
+        self.connection = connection
+        self.hold = hold
+        self.table_name = table_name
+        self.columns = columns
+        self.workers = workers
+        self.staging_tables = [staging_name(table_name, i) for i in range(workers)] if staging else []
+        self.loaders = [
+            CopyLoader(target, columns, types, batch_size=batch_size, copy_format=copy_format)
+            for target in (self.staging_tables or [table_name] * workers)
+        ]
+        self.rows_count = 0
+        self._queue = queue.Queue(maxsize=workers * 2)
+        self._errors = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def prepare_time(self) -> float:
+        return sum(loader.prepare_time for loader in self.loaders)
+
+    @property
+    def insert_time(self) -> float:
+        return sum(loader.insert_time for loader in self.loaders)
+
+    def create_staging(self):
+        # UNLOGGED: staging rows are thrown away after the final insert, WAL would be wasted
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                for staging in self.staging_tables:
+                    cursor.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE {} INCLUDING DEFAULTS)").format(
+                        sql.Identifier(staging), sql.Identifier(self.table_name)
+                    ))
+
+    def drop_staging(self):
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                for staging in self.staging_tables:
+                    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging)))
+
+    def _work(self, loader: CopyLoader):
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    while not self._stop.is_set():
+                        try:
+                            batch = self._queue.get(timeout=QUEUE_TIMEOUT)
+                        except queue.Empty:
+                            continue
+                        if batch is None:
+                            break
+                        loader.copy_batch(cursor, batch)
+                        with self._lock:
+                            self.rows_count += len(batch)
+        except Exception as _ex:
+            self._errors.append(_ex)
+            self._stop.set()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=QUEUE_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def _distribute(self, batches: Iterable[List[list]], progress: Optional[Callable[[int], None]]):
+        threads = [
+            threading.Thread(target=self._work, args=(loader,), name="copy-{}".format(i), daemon=True)
+            for i, loader in enumerate(self.loaders)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            # The shared queue hands each batch to whichever worker is free
+            for batch in batches:
+                if batch:
+                    self._put(batch)
+                    if progress:
+                        progress(self.rows_count)
+            for _ in threads:
+                self._put(None)
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+        self._raise_error()
+
+    def merge(self):
+        columns = sql.SQL(", ").join(sql.Identifier(column) for column in self.columns)
+        with timed("copy_merge", table=self.table_name) as span, self.connection() as conn:
+            with conn.cursor() as cursor:
+                for staging in self.staging_tables:
+                    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                        sql.Identifier(self.table_name), columns, columns, sql.Identifier(staging)
+                    ))
+            span.add(rows=self.rows_count)
+
+    def load_batches(self, batches: Iterable[List[list]],
+                     progress: Optional[Callable[[int], None]] = None) -> int:
+        if not self.staging_tables:
+            self._distribute(batches, progress)
+            return self.rows_count
+        with self.hold(self.staging_tables) if self.hold else nullcontext():
+            self.create_staging()
+            try:
+                self._distribute(batches, progress)
+                if progress:
+                    progress(self.rows_count)
+                self.merge()
+            finally:
+                self.drop_staging()
+        return self.rows_count
@@ -0,0 +1,162 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Literal, Optional
+
+from psycopg2 import sql
+
+from postgres.copy_loader import CopyLoader, COPY_FORMATS, DEFAULT_BATCH_SIZE, batched, normalize_type
+from postgres.query_builder import short_identifier
+
+PARTITION_INTERVALS = Literal[
+    "day",
+    "week",
+    "month",
+    "year",
+]
+# Marker in the table comment, the catalog reads the partitioning back from it
+COMMENT_KEY = "partitioning"
+
+PARTITIONS_QUERY = (
+    "SELECT c.relname FROM pg_catalog.pg_inherits i "
+    "JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid "
+    "WHERE i.inhparent = %s::regclass"
+)
+
+
+class RangePartitioning:
+    def __init__(self, table_name: str, column: str, column_type: str, interval):
+        self.table_name = table_name
+        self.column = column
+        self.column_type = normalize_type(column_type)
+        if self.column_type == "timestamp":
+            if interval not in PARTITION_INTERVALS.__args__:
+                raise Exception(f"Unknown partition interval: {interval}")
+        elif self.column_type == "int":
+            interval = int(interval)
+            if interval <= 0:
+                raise Exception("Partition step must be positive")
+        else:
+            raise Exception("Only timestamp and int columns can be range partitioned")
+        self.interval = interval
+
+    @classmethod
+    def from_comment(cls, table_name: str, columns: List[str], types: List[str],
+                     comment: Optional[str]) -> Optional["RangePartitioning"]:
+        try:
+            spec = json.loads(comment)[COMMENT_KEY]
+        except (TypeError, ValueError, KeyError):
+            return None
+        return cls(table_name, spec["column"], types[columns.index(spec["column"])], spec["interval"])
+
+    def comment(self) -> str:
+        return json.dumps({COMMENT_KEY: {"column": self.column, "interval": self.interval}})
+
+    def bounds(self, value) -> Optional[tuple]:
+        # [lower, upper) range of the partition that holds value; NULLs go to the default partition
+        if value is None:
+            return None
+        if self.column_type == "int":
+            lower = value // self.interval * self.interval
+            return lower, lower + self.interval
+        day = datetime(value.year, value.month, value.day)
+        if self.interval == "day":
+            return day, day + timedelta(days=1)
+        if self.interval == "week":
+            lower = day - timedelta(days=day.weekday())
+            return lower, lower + timedelta(days=7)
+        if self.interval == "month":
+            lower = day.replace(day=1)
+            upper = lower.replace(year=lower.year + 1, month=1) if lower.month == 12 else lower.replace(month=lower.month + 1)
+            return lower, upper
+        lower = day.replace(month=1, day=1)
+        return lower, lower.replace(year=lower.year + 1)
+
+    def partition_name(self, bounds: Optional[tuple]) -> str:
+        if bounds is None:
+            return short_identifier("{}_default".format(self.table_name))
+        lower = bounds[0]
+        if self.column_type == "int":
+            suffix = "m{}".format(-lower) if lower < 0 else str(lower)
+        else:
+            suffix = lower.strftime("%Y%m%d")
+        return short_identifier("{}_p{}".format(self.table_name, suffix))
+
+    def create_partition_query(self, bounds: Optional[tuple]) -> sql.Composed:
+        name = sql.Identifier(self.partition_name(bounds))
+        parent = sql.Identifier(self.table_name)
+        if bounds is None:
+            return sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(name, parent)
+        return sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})").format(
+            name, parent, sql.Literal(bounds[0]), sql.Literal(bounds[1])
+        )
+
+    def comment_query(self) -> sql.Composed:
+        return sql.SQL("COMMENT ON TABLE {} IS {}").format(sql.Identifier(self.table_name), sql.Literal(self.comment()))
+
+
+class PartitionedCopyLoader:
+    # Rows are grouped by partition and copied straight into the child tables, creating missing ones,
+    # so the server neither routes every row through the parent nor rejects rows without a partition
+    def __init__(self, partitioning: RangePartitioning,
+                 columns: List[str],
+                 types: List[str],
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 copy_format: COPY_FORMATS = "text"):
+        self.partitioning = partitioning
+        self.columns = columns
+        self.types = types
+        self.batch_size = batch_size
+        self.copy_format = copy_format
+        self.key_index = columns.index(partitioning.column)
+        self.loaders: Dict[str, CopyLoader] = {}
+        self.existing = None
+        self.rows_count = 0
+
+    @property
+    def prepare_time(self) -> float:
+        return sum(loader.prepare_time for loader in self.loaders.values())
+
+    @property
+    def insert_time(self) -> float:
+        return sum(loader.insert_time for loader in self.loaders.values())
+
+    def partition_loader(self, cursor, bounds: Optional[tuple]) -> CopyLoader:
+        name = self.partitioning.partition_name(bounds)
+        if self.existing is None:
+            cursor.execute(PARTITIONS_QUERY, (self.partitioning.table_name,))
+            self.existing = {row[0] for row in cursor.fetchall()}
+        if name not in self.existing:
+            cursor.execute(self.partitioning.create_partition_query(bounds))
+            self.existing.add(name)
+        if name not in self.loaders:
+            self.loaders[name] = CopyLoader(name, self.columns, self.types,
+                                            batch_size=self.batch_size, copy_format=self.copy_format)
+        return self.loaders[name]
+
+    def copy_batch(self, cursor, rows: List[list]) -> int:
+        groups = defaultdict(list)
+        bounds = self.partitioning.bounds
+        key_index = self.key_index
+        for row in rows:
+            groups[bounds(row[key_index])].append(row)
+        for partition_bounds, partition_rows in groups.items():
+            self.partition_loader(cursor, partition_bounds).copy_batch(cursor, partition_rows)
+        self.rows_count += len(rows)
+        return len(rows)
+
+    def load_batches(self, connection,
+                     batches: Iterable[List[list]],
+                     progress: Optional[Callable[[int], None]] = None) -> int:
+        with connection.cursor() as cursor:
+            for batch in batches:
+                if not batch:
+                    continue
+                self.copy_batch(cursor, batch)
+                if progress:
+                    progress(self.rows_count)
+        return self.rows_count
+
+    def load(self, connection, rows: Iterable[list],
+             progress: Optional[Callable[[int], None]] = None) -> int:
+        return self.load_batches(connection, batched(rows, self.batch_size), progress)
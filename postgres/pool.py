@@ -0,0 +1,183 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionSettings:
+    def __init__(self, database: str = None,
+                 user: str = None,
+                 password: str = None,
+                 host: str = "localhost",
+                 port: int = 5432,
+                 **options):
+        self.database = database
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        # Any other libpq keyword: sslmode, connect_timeout, application_name, options...
+        self.options = options
+
+    def connect_kwargs(self) -> dict:
+        kwargs = {
+            "user": self.user,
+            "password": self.password,
+            "host": self.host,
+            "port": self.port,
+            **self.options,
+        }
+        if self.database:
+            kwargs["database"] = self.database
+        return {key: value for key, value in kwargs.items() if value is not None}
+
+    def connect(self):
+        return psycopg2.connect(**self.connect_kwargs())
+
+
+class ConnectionPool:
+    def __init__(self, settings: ConnectionSettings,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0,
+                 timeout: float = 30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise Exception("Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self.settings = settings
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.closed = False
+        self._idle = deque()
+        self._in_use = set()
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+        try:
+            for _ in range(min_size):
+                self._idle.append((self.settings.connect(), monotonic()))
+        except Exception:
+            for conn, _ in self._idle:
+                conn.close()
+            raise
+
+    def __len__(self):
+        with self._condition:
+            return len(self._idle) + len(self._in_use)
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _prune_idle(self):
+        now = monotonic()
+        while len(self._idle) + len(self._in_use) > self.min_size and self._idle:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            conn.close()
+
+    def getconn(self):
+        deadline = monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._condition:
+                while True:
+                    if self.closed:
+                        raise PoolTimeout("Pool is closed")
+                    self._prune_idle()
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        self._in_use.add(conn)
+                        break
+                    if len(self._in_use) < self.max_size:
+                        break
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No free connection in {self.timeout} seconds")
+                    self._condition.wait(remaining)
+                if conn is None:
+                    # Reserve the slot before connecting outside of the lock
+                    placeholder = object()
+                    self._in_use.add(placeholder)
+            if conn is None:
+                break
+            # The health check is a round trip to the server, so the slot is held without the lock
+            if self._is_healthy(conn, last_used):
+                return conn
+            conn.close()
+            with self._condition:
+                self._in_use.discard(conn)
+                self._condition.notify()
+
+        conn = None
+        try:
+            conn = self.settings.connect()
+        finally:
+            with self._condition:
+                self._in_use.discard(placeholder)
+                if conn is not None:
+                    self._in_use.add(conn)
+                self._condition.notify()
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        with self._condition:
+            self._in_use.discard(conn)
+            if not conn.closed and not discard and not self.closed:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+                if not discard:
+                    self._idle.append((conn, monotonic()))
+                    conn = None
+            if conn is not None and not conn.closed:
+                conn.close()
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        # Nested calls in one thread share the connection and its transaction
+        current = getattr(self._local, "connection", None)
+        if current is not None:
+            yield current
+            return
+
+        conn = self.getconn()
+        self._local.connection = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.connection = None
+            self.putconn(conn)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                conn.close()
+            self._condition.notify_all()
@@ -0,0 +1,59 @@
+import re
+from threading import Lock
+from typing import Dict, List
+from weakref import WeakKeyDictionary
+
+from psycopg2 import sql
+
+from postgres.query_builder import short_identifier
+
+PLACEHOLDER = re.compile(r"%([s%])")
+
+
+def to_positional(query_text: str) -> str:
+    # psycopg2 "%s" placeholders become the "$1, $2..." parameters PREPARE expects
+    counter = iter(range(1, query_text.count("%s") + 1))
+    return PLACEHOLDER.sub(lambda match: "%" if match.group(1) == "%" else "${}".format(next(counter)), query_text)
+
+
+class PreparedStatements:
+    def __init__(self):
+        # connection -> {statement name: table generation it was prepared for}
+        self._statements = WeakKeyDictionary()
+        self._generations: Dict[str, int] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def statement_name(table_name: str, purpose: str) -> str:
+        return short_identifier("{}__{}".format(table_name, purpose))
+
+    def execute(self, cursor, table_name: str, purpose: str,
+                query: sql.Composable, params: List = None):
+        conn = cursor.connection
+        name = self.statement_name(table_name, purpose)
+        with self._lock:
+            prepared = self._statements.setdefault(conn, {})
+            generation = self._generations.get(table_name, 0)
+
+        # A purpose must always map to the same statement shape for a given table generation
+        current = prepared.get(name)
+        if current != generation:
+            if current is not None:
+                cursor.execute(sql.SQL("DEALLOCATE {}").format(sql.Identifier(name)))
+                del prepared[name]
+            query_text = to_positional(query.as_string(conn))
+            cursor.execute(sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)) + sql.SQL(query_text))
+            prepared[name] = generation
+
+        params = list(params or [])
+        if params:
+            cursor.execute(sql.SQL("EXECUTE {} ({})").format(
+                sql.Identifier(name), sql.SQL(", ").join(sql.Placeholder() for _ in params)
+            ), params)
+        else:
+            cursor.execute(sql.SQL("EXECUTE {}").format(sql.Identifier(name)))
+
+    def invalidate(self, table_name: str):
+        # Statements are re-prepared lazily on each connection the next time they are used
+        with self._lock:
+            self._generations[table_name] = self._generations.get(table_name, 0) + 1
@@ -1,7 +1,27 @@
-from typing import Literal, List, Any, Dict
+from functools import lru_cache
+from hashlib import md5
+from typing import Literal, List, Any, Dict, Tuple, Union
+
+from psycopg2 import sql
 
 from postgres.builder_source import *
 
+QUERY_CACHE_SIZE = 512
+MAX_IDENTIFIER_BYTES = 63
+_rendered_queries = {}
+
+# {"a": 1, "b": None, "c": (">", 5)} or [("c", ">", 5), ("c", "<", 9)]
+SelectParameters = Union[Dict[str, Any], List[Tuple[str, str, Any]]]
+
+
+def short_identifier(name: str) -> str:
+    # PostgreSQL cuts identifiers at 63 bytes, an md5 suffix of the full name keeps long names distinct
+    encoded = name.encode("utf-8")
+    if len(encoded) <= MAX_IDENTIFIER_BYTES:
+        return name
+    digest = md5(encoded).hexdigest()[:8]
+    return "{}_{}".format(encoded[:MAX_IDENTIFIER_BYTES - len(digest) - 1].decode("utf-8", "ignore"), digest)
+
 
 class QueryBuilderBase:
     QUERY_TYPES = Literal[
@@ -14,6 +34,31 @@ class QueryBuilderBase:
         "AND",
         "OR"
     ]
+    COMPARISON_OPERATORS = (
+        EQUAL,
+        NOT_EQUAL,
+        LESS,
+        LESS_EQUAL,
+        GREATER,
+        GREATER_EQUAL,
+        LIKE,
+        ILIKE,
+        IN,
+    )
+    INDEX_METHODS = (
+        "btree",
+        "hash",
+        "brin",
+    )
+    COLUMN_TYPES = (
+        "int",
+        "integer",
+        "float",
+        "double precision",
+        "text",
+        "timestamp",
+        "timestamp without time zone",
+    )
 
     @staticmethod
     def create_query(_type: QUERY_TYPES,
@@ -22,47 +67,265 @@ class QueryBuilderBase:
                      table_columns: List[str] = None,
                      values: List[str] = None,
                      select_operation: SELECT_OPERATORS = OR,
-                     select_parameters: Dict[str, Any] = None,
+                     select_parameters: SelectParameters = None,
                      select_columns: bool = False,
-                     select_tables: bool = False
-                     ) -> str:
+                     select_tables: bool = False,
+                     column_definitions: List[dict] = None,  # for table create, ColumnElement.to_dict() items
+                     partition_by: str = '',  # for table create, range partition column
+                     unlogged: bool = False,  # for table create
+                     order_by: List[str] = None,
+                     descending: bool = False,
+                     keyset: bool = False,  # rows after the order_by values passed as parameters
+                     limit: bool = False,
+                     offset: bool = False
+                     ) -> sql.Composed:
 
         # Parameters validation
-        if select_parameters is None:
-            select_parameters = {}
+        predicates = QueryBuilderBase.normalize_predicates(select_parameters)
         if table_columns is None:
             table_columns = []
         if values is None:
             values = []
-        for key in select_parameters.keys():
-            if key not in table_columns:
-                raise Exception(f"{key} not found in Table columns")
+        if column_definitions is None:
+            column_definitions = []
+        if order_by is None:
+            order_by = []
+        if _type in (INSERT, UPDATE) and len(table_columns) != len(values):
+            raise Exception("Values count must coincide with Table Columns count")
+        if select_operation not in (AND, OR):
+            raise Exception(f"Unknown select operation: {select_operation}")
+        if keyset and not order_by:
+            raise Exception("Keyset pagination needs order_by columns")
+
+        # Only the shape of the statement is part of the cache key, values are passed separately
+        return QueryBuilderBase.compile(
+            _type, database_name, table_name, tuple(table_columns),
+            select_operation,
+            tuple((column, operator, value is None) for column, operator, value in predicates),
+            select_columns, select_tables,
+            tuple((item["name"], item["type"], item["is_unique"], item["null"]) for item in column_definitions),
+            partition_by, unlogged, tuple(order_by), descending, keyset, limit, offset
+        )
 
-        query = _type
+    @staticmethod
+    def normalize_predicates(select_parameters: SelectParameters = None) -> List[tuple]:
+        if not select_parameters:
+            return []
+        if isinstance(select_parameters, dict):
+            return [
+                (column, *value) if isinstance(value, tuple) else (column, EQUAL, value)
+                for column, value in select_parameters.items()
+            ]
+        return [tuple(item) for item in select_parameters]
+
+    @staticmethod
+    def create_params(values: List[Any] = None,
+                      select_parameters: SelectParameters = None,
+                      keyset_values: List[Any] = None,
+                      limit: int = None,
+                      offset: int = None) -> list:
+        params = list(values or [])
+        params.extend(
+            value for _, _, value in QueryBuilderBase.normalize_predicates(select_parameters) if value is not None
+        )
+        params.extend(keyset_values or [])
+        if limit is not None:
+            params.append(limit)
+        if offset is not None:
+            params.append(offset)
+        return params
+
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def compile(_type: QUERY_TYPES,
+                database_name: str,
+                table_name: str,
+                table_columns: Tuple[str, ...],
+                select_operation: SELECT_OPERATORS,
+                select_parameters: Tuple[Tuple[str, str, bool], ...],
+                select_columns: bool,
+                select_tables: bool,
+                column_definitions: Tuple[tuple, ...],
+                partition_by: str,
+                unlogged: bool,
+                order_by: Tuple[str, ...],
+                descending: bool,
+                keyset: bool,
+                limit: bool,
+                offset: bool) -> sql.Composed:
+        table = sql.Identifier(table_name)
+        columns = sql.SQL(", ").join(sql.Identifier(column) for column in table_columns)
+        where = QueryBuilderBase.compile_where(select_operation, select_parameters)
+        order_columns = sql.SQL(", ").join(sql.Identifier(column) for column in order_by)
 
         match _type:
             case "CREATE":
-                ...
+                if database_name:
+                    return sql.SQL("{} DATABASE {}").format(sql.SQL(CREATE), sql.Identifier(database_name))
+                definitions = []
+                for name, column_type, is_unique, null in column_definitions:
+                    if column_type not in QueryBuilderBase.COLUMN_TYPES:
+                        raise Exception(f"Unknown column type: {column_type}")
+                    definition = sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(column_type))
+                    definition += sql.SQL(" PRIMARY KEY") if is_unique else sql.SQL("")
+                    definition += sql.SQL(" NOT NULL") if null else sql.SQL("")
+                    definitions.append(definition)
+                query = sql.SQL("{} {}TABLE {} ({})").format(
+                    sql.SQL(CREATE), sql.SQL("UNLOGGED " if unlogged else ""), table, sql.SQL(", ").join(definitions)
+                )
+                if partition_by:
+                    if any(is_unique and name != partition_by for name, _, is_unique, _ in column_definitions):
+                        raise Exception("Primary key of a partitioned table must include the partition column")
+                    query += sql.SQL(" PARTITION BY RANGE ({})").format(sql.Identifier(partition_by))
+                return query
             case "SELECT":
                 if select_tables:
-                    query = f"{_type} {ALL} {FROM} {SCHEMA}.{TABLES} {WHERE} {TABLE_SCHEMA}={PUBLIC_SCHEMA}"
-                elif select_columns:
-                    query = f"{_type} {ALL} {FROM} {SCHEMA}.{COLUMNS} {WHERE} table_name='{table_name}'"
-                else:
-                    query = f""
+                    return sql.SQL(f"{SELECT} {ALL} {FROM} {SCHEMA}.{TABLES} {WHERE} {TABLE_SCHEMA}={PUBLIC_SCHEMA}")
+                if select_columns:
+                    return sql.SQL(f"{SELECT} {ALL} {FROM} {SCHEMA}.{COLUMNS} {WHERE} table_name = {{}}").format(
+                        sql.Literal(table_name)
+                    )
+                query = sql.SQL("{} {} {} {}").format(
+                    sql.SQL(SELECT), columns if table_columns else sql.SQL(ALL), sql.SQL(FROM), table
+                )
+                if keyset:
+                    # Row comparison, so a multi-column order resumes exactly after the last row seen
+                    keyset_condition = sql.SQL("({}) {} ({})").format(
+                        order_columns, sql.SQL(LESS if descending else GREATER),
+                        sql.SQL(", ").join(sql.Placeholder() for _ in order_by)
+                    )
+                    where = QueryBuilderBase.compile_where(select_operation, select_parameters, keyset_condition)
+                query += where
+                if order_by:
+                    direction = sql.SQL(f" {DESC}") if descending else sql.SQL("")
+                    query += sql.SQL(" {} {}").format(sql.SQL(ORDER_BY), sql.SQL(", ").join(
+                        sql.Identifier(column) + direction for column in order_by
+                    ))
+                if limit:
+                    query += sql.SQL(" LIMIT %s")
+                if offset:
+                    query += sql.SQL(" OFFSET %s")
+                return query
             case "INSERT":
-                if len(table_columns) != len(values):
-                    raise Exception("Values count must coincide with Table Columns count")
+                return sql.SQL("{} INTO {} ({}) VALUES ({})").format(
+                    sql.SQL(INSERT), table, columns,
+                    sql.SQL(", ").join(sql.Placeholder() for _ in table_columns)
+                )
             case "UPDATE":
-                if len(table_columns) != len(values):
-                    raise Exception("Values count must coincide with Table Columns count")
+                assignments = sql.SQL(", ").join(
+                    sql.SQL("{} = %s").format(sql.Identifier(column)) for column in table_columns
+                )
+                return sql.SQL("{} {} SET {}").format(sql.SQL(UPDATE), table, assignments) + where
+        raise Exception(f"Unknown query type: {_type}")
 
-        return query
+    @staticmethod
+    def render(query: sql.Composable, conn) -> str:
+        # Compiled queries are shared objects, so their text is kept per query and connection encoding
+        key = (id(query), conn.encoding)
+        cached = _rendered_queries.get(key)
+        if cached is None or cached[0] is not query:
+            if len(_rendered_queries) >= QUERY_CACHE_SIZE * 2:
+                _rendered_queries.clear()
+            cached = (query, query.as_string(conn))
+            _rendered_queries[key] = cached
+        return cached[1]
+
+    @staticmethod
+    def compile_condition(column: str, operator: str, is_null: bool) -> sql.Composable:
+        if operator not in QueryBuilderBase.COMPARISON_OPERATORS:
+            raise Exception(f"Unknown comparison operator: {operator}")
+        if is_null:
+            if operator not in (EQUAL, NOT_EQUAL):
+                raise Exception(f"NULL can only be compared with {EQUAL} or {NOT_EQUAL}")
+            return sql.SQL("{} IS NULL" if operator == EQUAL else "{} IS NOT NULL").format(sql.Identifier(column))
+        if operator == IN:
+            # The values list is passed as one array parameter, so the statement shape does not depend on its size
+            return sql.SQL("{} = ANY(%s)").format(sql.Identifier(column))
+        return sql.SQL("{} {} %s").format(sql.Identifier(column), sql.SQL(operator))
+
+    @staticmethod
+    def compile_where(select_operation: SELECT_OPERATORS,
+                      select_parameters: Tuple[Tuple[str, str, bool], ...],
+                      keyset_condition: sql.Composable = None) -> sql.Composable:
+        conditions = None
+        if select_parameters:
+            conditions = sql.SQL(f" {select_operation} ").join(
+                QueryBuilderBase.compile_condition(*item) for item in select_parameters
+            )
+        if keyset_condition is not None:
+            conditions = keyset_condition if conditions is None else \
+                sql.SQL("({}) {} {}").format(conditions, sql.SQL(AND), keyset_condition)
+        if conditions is None:
+            return sql.SQL("")
+        return sql.SQL(" {} ").format(sql.SQL(WHERE)) + conditions
 
 
 class QueryBuilder(QueryBuilderBase):
 
-    @staticmethod
-    def select_query() -> str:
-        query = super().create_query("SELECT")
-        return f""
+    @classmethod
+    def select_query(cls, table_name: str,
+                     table_columns: List[str] = None,
+                     select_parameters: SelectParameters = None,
+                     select_operation: QueryBuilderBase.SELECT_OPERATORS = AND,
+                     order_by: List[str] = None,
+                     descending: bool = False,
+                     after: tuple = None,
+                     limit: int = None,
+                     offset: int = None) -> tuple:
+        # after holds the order_by values of the last row of the previous page
+        query = cls.create_query(SELECT, table_name=table_name,
+                                 table_columns=table_columns,
+                                 select_operation=select_operation,
+                                 select_parameters=select_parameters,
+                                 order_by=order_by,
+                                 descending=descending,
+                                 keyset=after is not None,
+                                 limit=limit is not None,
+                                 offset=offset is not None)
+        return query, cls.create_params(select_parameters=select_parameters, keyset_values=after,
+                                        limit=limit, offset=offset)
+
+    @classmethod
+    def insert_query(cls, table_name: str, table_columns: List[str], values: List[Any]) -> tuple:
+        query = cls.create_query(INSERT, table_name=table_name, table_columns=table_columns, values=values)
+        return query, cls.create_params(values=values)
+
+    @classmethod
+    def update_query(cls, table_name: str,
+                     table_columns: List[str],
+                     values: List[Any],
+                     select_parameters: SelectParameters = None,
+                     select_operation: QueryBuilderBase.SELECT_OPERATORS = AND) -> tuple:
+        query = cls.create_query(UPDATE, table_name=table_name,
+                                 table_columns=table_columns,
+                                 values=values,
+                                 select_operation=select_operation,
+                                 select_parameters=select_parameters)
+        return query, cls.create_params(values=values, select_parameters=select_parameters)
+
+    @classmethod
+    def create_table_query(cls, table_name: str, column_definitions: List[dict],
+                           partition_by: str = '',
+                           unlogged: bool = False) -> sql.Composed:
+        if partition_by and unlogged:
+            raise Exception("Partitioned tables cannot be UNLOGGED")
+        return cls.create_query(CREATE, table_name=table_name, column_definitions=column_definitions,
+                                partition_by=partition_by, unlogged=unlogged)
+
+    @classmethod
+    def create_index_query(cls, table_name: str, columns: List[str], method: str = "btree") -> sql.Composed:
+        if method not in cls.INDEX_METHODS:
+            raise Exception(f"Unknown index method: {method}")
+        if not columns:
+            raise Exception("Index needs at least one column")
+        if method == "hash" and len(columns) > 1:
+            raise Exception("Hash indexes support a single column only")
+        name = short_identifier("{}_{}_{}_idx".format(table_name, "_".join(columns), method))
+        return sql.SQL("{} INDEX IF NOT EXISTS {} ON {} USING {} ({})").format(
+            sql.SQL(CREATE), sql.Identifier(name), sql.Identifier(table_name), sql.SQL(method),
+            sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+        )
+
+    @classmethod
+    def create_database_query(cls, database_name: str) -> sql.Composed:
+        return cls.create_query(CREATE, database_name=database_name)
@@ -0,0 +1,94 @@
+import sys
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Set, Tuple
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60.0
+MISS = object()
+
+
+def estimate_size(value) -> int:
+    # Rows are lists or tuples of scalars, so one level of nesting covers a result set
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def freeze(value) -> Hashable:
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # (table name, key) -> (value, size, expires at)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[object, int, float]]" = OrderedDict()
+        self._tables: Dict[str, Set[Hashable]] = {}
+        # Bumped by invalidate, a read that started before it must not store its result afterwards
+        self._generations: Dict[str, int] = {}
+        self._clears = 0
+        self._lock = Lock()
+
+    def get(self, table_name: str, key: Hashable):
+        entry_key = (table_name, freeze(key))
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[2] > monotonic():
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(entry_key)
+            self.misses += 1
+            return MISS
+
+    def generation(self, table_name: str) -> tuple:
+        # Take it before reading from the database and pass it to put
+        with self._lock:
+            return self._clears, self._generations.get(table_name, 0)
+
+    def put(self, table_name: str, key: Hashable, value, ttl: float = None, generation: tuple = None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        entry_key = (table_name, freeze(key))
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._generations.get(table_name, 0)):
+                return
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = (value, size, monotonic() + (self.ttl if ttl is None else ttl))
+            self._tables.setdefault(table_name, set()).add(entry_key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_key: Tuple[str, Hashable]):
+        _, size, _ = self._entries.pop(entry_key)
+        self.size -= size
+        keys = self._tables.get(entry_key[0])
+        if keys is not None:
+            keys.discard(entry_key)
+            if not keys:
+                del self._tables[entry_key[0]]
+
+    def invalidate(self, table_name: str):
+        with self._lock:
+            self._generations[table_name] = self._generations.get(table_name, 0) + 1
+            for entry_key in list(self._tables.get(table_name, ())):
+                self._remove(entry_key)
+
+    def clear(self):
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._tables.clear()
+            self.size = 0
@@ -0,0 +1,83 @@
+import re
+import uuid
+from contextlib import contextmanager
+from time import time
+from typing import Callable, Iterable, List
+
+import psycopg2
+from psycopg2 import sql
+
+# UNLOGGED tables named like this are hidden from the catalog; the token starts with the creation time
+# in hex seconds, so tables a crashed load left behind can be told apart from loads still running
+STAGING_PATTERN = r"_staging_([0-9a-f]{8})[0-9a-f]{4}(_[0-9]+)?$"
+STALE_AFTER = 24 * 60 * 60
+PREFIX_BYTES = 36
+
+# Loads hold a session advisory lock (STAGING_LOCK_CLASS, hashtext(name)) per staging table until they finish,
+# the server drops it with the session if the process dies
+STAGING_LOCK_CLASS = 0x5354
+LOCK_STAGING_QUERY = "SELECT pg_advisory_lock(%s, hashtext(name)) FROM unnest(%s::text[]) AS name"
+TRY_LOCK_STAGING_QUERY = "SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))"
+
+STALE_STAGING_QUERY = (
+    "SELECT c.relname FROM pg_catalog.pg_class c "
+    "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE n.nspname = %s AND c.relkind = 'r' AND c.relpersistence = 'u' AND c.relname ~ %s"
+)
+
+
+def staging_name(table_name: str, worker: int = None) -> str:
+    # The prefix is cut by bytes so the token always survives the 63-byte identifier limit
+    prefix = table_name.encode("utf-8")[:PREFIX_BYTES].decode("utf-8", "ignore")
+    name = "{}_staging_{:08x}{}".format(prefix, int(time()), uuid.uuid4().hex[:4])
+    return name if worker is None else "{}_{}".format(name, worker)
+
+
+def staging_created(name: str):
+    match = re.search(STAGING_PATTERN, name)
+    return int(match.group(1), 16) if match else None
+
+
+@contextmanager
+def holding_staging(pool, names: Iterable[str]):
+    # The locks live on a connection of their own: the load's connections commit and go back to the pool meanwhile
+    conn = pool.getconn()
+    discard = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(LOCK_STAGING_QUERY, (STAGING_LOCK_CLASS, list(names)))
+        conn.commit()
+        yield
+    finally:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock_all()")
+            conn.commit()
+        except psycopg2.Error:
+            discard = True
+        pool.putconn(conn, discard=discard)
+
+
+def drop_stale_staging(connection: Callable, schema: str = "public", max_age: float = STALE_AFTER) -> List[str]:
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(STALE_STAGING_QUERY, (schema, STAGING_PATTERN))
+            names = [row[0] for row in cursor.fetchall()]
+    now = time()
+    dropped = []
+    # One transaction per table: a table owned by another role is skipped, not the whole cleanup
+    for name in names:
+        if now - staging_created(name) <= max_age:
+            continue
+        try:
+            with connection() as conn:
+                with conn.cursor() as cursor:
+                    # A load that is still running holds the lock, however old its table is
+                    cursor.execute(TRY_LOCK_STAGING_QUERY, (STAGING_LOCK_CLASS, name))
+                    if not cursor.fetchone()[0]:
+                        continue
+                    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(schema, name)))
+        except psycopg2.Error:
+            continue
+        dropped.append(name)
+    return dropped
@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+DEFAULT_WORKERS = 4
+POLL_INTERVAL_MS = 50
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, executor: "TaskExecutor",
+                 on_done: Optional[Callable] = None,
+                 on_error: Optional[Callable] = None,
+                 on_progress: Optional[Callable] = None,
+                 on_cancelled: Optional[Callable] = None):
+        self.executor = executor
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancelled = on_cancelled
+        self.future: Optional[Future] = None
+        self._cancelled = threading.Event()
+        self._cancel_callbacks: List[Callable] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+        # Callbacks run under the lock, so a connection cannot go back to the pool while it is being cancelled
+        with self._lock:
+            self._cancelled.set()
+            for callback in self._cancel_callbacks:
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Cancel callback failed")
+
+    def on_cancel(self, callback: Callable):
+        # e.g. connection.cancel, to interrupt a query that is already running on the server
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+            cancelled = self.cancelled
+        if cancelled:
+            callback()
+
+    def remove_cancel(self, callback: Callable):
+        with self._lock:
+            if callback in self._cancel_callbacks:
+                self._cancel_callbacks.remove(callback)
+
+    def check(self):
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def report(self, *progress):
+        # Called from the worker thread: the callback itself runs later on the Tk thread
+        self.check()
+        if self.on_progress:
+            self.executor.post(self.on_progress, *progress)
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+
+def current_task() -> Optional[Task]:
+    # The task whose worker runs in this thread, None outside of tasks
+    return getattr(_local, "task", None)
+
+
+@contextmanager
+def running(task: Optional[Task]):
+    previous = current_task()
+    _local.task = task
+    try:
+        yield task
+    finally:
+        _local.task = previous
+
+
+def bind(fn: Callable, task: Optional[Task] = None) -> Callable:
+    # For threads a task starts itself: fn runs with the task as their current task as well
+    task = task or current_task()
+
+    def run(*args, **kwargs):
+        with running(task):
+            return fn(*args, **kwargs)
+    return run
+
+
+class TaskExecutor:
+    def __init__(self, window, max_workers: int = DEFAULT_WORKERS,
+                 poll_interval: int = POLL_INTERVAL_MS):
+        self.window = window
+        self.poll_interval = poll_interval
+        self.closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-task")
+        self._events = queue.SimpleQueue()
+        self._tasks: List[Task] = []
+        self.window.after(self.poll_interval, self._poll)
+
+    def submit(self, fn: Callable, *args,
+               on_done: Optional[Callable] = None,
+               on_error: Optional[Callable] = None,
+               on_progress: Optional[Callable] = None,
+               on_cancelled: Optional[Callable] = None,
+               **kwargs) -> Task:
+        # fn is called in a worker thread as fn(task, *args, **kwargs)
+        task = Task(self, on_done, on_error, on_progress, on_cancelled)
+        task.future = self._pool.submit(bind(fn, task), task, *args, **kwargs)
+        task.future.add_done_callback(lambda future: self._finished(task, future))
+        self._tasks.append(task)
+        return task
+
+    def post(self, callback: Callable, *args):
+        self._events.put((callback, args))
+
+    def _finished(self, task: Task, future: Future):
+        # on_cancelled only fires once the worker has returned, e.g. after its cleanup
+        if future.cancelled():
+            if task.on_cancelled:
+                self.post(task.on_cancelled)
+            return
+        error = future.exception()
+        if error is None:
+            if task.on_done:
+                self.post(task.on_done, future.result())
+        elif isinstance(error, TaskCancelled) or task.cancelled:
+            # A cancelled query fails with QueryCanceledError rather than TaskCancelled
+            if task.on_cancelled:
+                self.post(task.on_cancelled)
+        elif task.on_error:
+            self.post(task.on_error, error)
+        else:
+            logger.error("Task failed: %s", error)
+
+    def _poll(self):
+        if self.closed:
+            return
+        while True:
+            try:
+                callback, args = self._events.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+            if self.closed:
+                return
+        self._tasks = [task for task in self._tasks if not task.done()]
+        self.window.after(self.poll_interval, self._poll)
+
+    def shutdown(self):
+        self.closed = True
+        for task in self._tasks:
+            task.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+from psycopg2 import sql
+
+from postgres.catalog import tables_from_rows
+from postgres.result_cache import ResultCache
+
+
+def render(query: sql.Composable) -> str:
+    # as_string needs a live connection, identifiers are quoted plainly here
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return ".".join('"{}"'.format(name.replace('"', '""')) for name in query.strings)
+    if isinstance(query, sql.Placeholder):
+        return "%s" if query.name is None else "%({})s".format(query.name)
+    if isinstance(query, sql.Literal):
+        return repr(query.wrapped)
+    return query.string
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def copy_expert(self, query, file):
+        self.executed.append((query, None))
+        self.rowcount = len(self.rows)
+
+
+class FakePrepared:
+    def __init__(self, pages):
+        self.pages = list(pages)
+        self.calls = []
+
+    def execute(self, cursor, table_name, purpose, query, params=None):
+        self.calls.append((purpose, query, params))
+        cursor.rows = self.pages.pop(0)
+
+
+class FakeCatalog:
+    def __init__(self, rows):
+        self.tables = tables_from_rows(rows)
+
+    def table(self, table_name):
+        return self.tables[table_name]
+
+
+class FakeDatabase:
+    def __init__(self, catalog_rows, pages, heaps=()):
+        # heaps are the rows HEAPS_QUERY returns, plain cursor queries all read them
+        self.heaps = list(heaps)
+        self.catalog = FakeCatalog(catalog_rows)
+        self.prepared = FakePrepared(pages)
+        self.cache = ResultCache()
+        self.cursors = []
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        self.cursors.append(FakeCursor(self.heaps))
+        return self.cursors[-1]
@@ -0,0 +1,56 @@
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import main
+from arrays import ColumnArrays, fetch_arrays
+from fakes import FakeDatabase
+from main import Table
+
+
+def test_buffers_grow_past_initial_capacity():
+    buffers = ColumnArrays(["n"], ["int"], capacity=2)
+    for start in range(0, 10, 3):
+        buffers.extend([(value,) for value in range(start, min(start + 3, 10))])
+    assert buffers.capacity >= 10
+    assert buffers.result()["n"].tolist() == list(range(10))
+
+
+def test_column_dtypes_and_nulls():
+    arrays = fetch_arrays([[(1, 1.5, "a", datetime(2024, 1, 1))], [(None, None, None, None)]],
+                          ["i", "f", "s", "t"], ["int", "float", "text", "timestamp"], capacity=1)
+    assert arrays["i"].dtype == np.float64 and np.isnan(arrays["i"][1])
+    assert arrays["f"].dtype == np.float64 and np.isnan(arrays["f"][1])
+    assert arrays["s"].tolist() == ["a", None]
+    assert np.isnat(arrays["t"][1])
+
+
+def test_fixed_width_text():
+    arrays = fetch_arrays([[("ab",), (None,)]], ["s"], ["text"], fixed_width_text=True)
+    assert arrays["s"].dtype.kind == "U"
+    assert arrays["s"].tolist() == ["ab", ""]
+
+
+def test_initial_capacity_ignores_huge_estimates(monkeypatch):
+    database = FakeDatabase([("t", "id", "integer", 1, True, True, "r", None, "p")], [])
+    table = Table(database, "t")
+    database.cache.put("t", ("count", False), 10 ** 12)
+    capacities = []
+
+    def fake_fetch(batches, columns, types, capacity, fixed_width_text):
+        capacities.append(capacity)
+        return {}
+
+    monkeypatch.setattr(main, "fetch_arrays", fake_fetch)
+    table.get_arrays(itersize=100)
+    assert capacities == [main.INITIAL_ARRAY_BATCHES * 100]
+
+
+def test_timestamptz_is_stored_as_naive_utc():
+    at = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=3)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        arrays = fetch_arrays([[(at,), (None,)]], ["t"], ["timestamp with time zone"])
+    assert arrays["t"][0] == np.datetime64("2024-01-02T00:04:05")
+    assert np.isnat(arrays["t"][1])
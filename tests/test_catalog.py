@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+from time import time
+
+import pytest
+
+from postgres.catalog import pick_estimate, tables_from_rows
+from postgres.query_builder import MAX_IDENTIFIER_BYTES
+from postgres.staging import (LOCK_STAGING_QUERY, STALE_AFTER, TRY_LOCK_STAGING_QUERY, drop_stale_staging,
+                              holding_staging, staging_created, staging_name)
+
+
+def test_pick_estimate_prefers_reltuples():
+    assert pick_estimate(1000, 900) == 1000
+
+
+def test_pick_estimate_uses_live_tuples_before_analyze():
+    assert pick_estimate(-1, 900) == 900
+    assert pick_estimate(0, 900) == 900
+
+
+def test_pick_estimate_needs_exact_count_without_statistics():
+    assert pick_estimate(-1, None) is None
+    assert pick_estimate(0, 0) is None
+
+
+def test_staging_tables_are_flagged():
+    rows = [
+        ("events", "id", "integer", 1, True, True, "r", None, "p"),
+        (staging_name("events"), "id", "integer", 1, True, True, "r", None, "u"),
+        (staging_name("events", 2), "id", "integer", 1, True, True, "r", None, "u"),
+        ("events_staging_notes", "id", "integer", 1, False, False, "r", None, "u"),
+    ]
+    tables = tables_from_rows(rows)
+    assert [name for name, info in tables.items() if not info.staging] == ["events", "events_staging_notes"]
+
+
+def test_staging_name_fits_identifier_and_keeps_token():
+    name = staging_name("таблица" * 10, 3)
+    assert len(name.encode("utf-8")) <= MAX_IDENTIFIER_BYTES
+    assert abs(staging_created(name) - time()) < 5
+
+
+class FakeStagingConnection:
+    def __init__(self, names, locked=()):
+        self.names = names
+        self.locked = locked
+        self.dropped = []
+        self.result = None
+
+    @contextmanager
+    def __call__(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, query, params=None):
+        if query == TRY_LOCK_STAGING_QUERY:
+            self.result = (params[1] not in self.locked,)
+        elif params is None:
+            self.dropped.append(query.seq[-1].strings[-1])
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return [(name,) for name in self.names]
+
+
+def test_drop_stale_staging_keeps_recent_tables(monkeypatch):
+    monkeypatch.setattr("postgres.staging.time", lambda: time() - STALE_AFTER - 60)
+    old = staging_name("events", 0)
+    monkeypatch.undo()
+    recent = staging_name("events", 1)
+    connection = FakeStagingConnection([old, recent])
+    assert drop_stale_staging(connection) == [old]
+    assert connection.dropped == [old]
+
+
+def test_drop_stale_staging_skips_tables_of_running_loads(monkeypatch):
+    monkeypatch.setattr("postgres.staging.time", lambda: time() - STALE_AFTER - 60)
+    running, crashed = staging_name("events", 0), staging_name("events", 1)
+    monkeypatch.undo()
+    connection = FakeStagingConnection([running, crashed], locked=[running])
+    assert drop_stale_staging(connection) == [crashed]
+    assert connection.dropped == [crashed]
+
+
+class FakeLockPool:
+    def __init__(self):
+        self.conn = FakeStagingConnection([])
+        self.conn.queries = []
+        self.conn.execute = lambda query, params=None: self.conn.queries.append(query)
+        self.conn.commit = lambda: None
+        self.returned = []
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, discard=False):
+        self.returned.append((conn, discard))
+
+
+def test_holding_staging_unlocks_and_returns_its_connection():
+    pool = FakeLockPool()
+    with pytest.raises(ValueError):
+        with holding_staging(pool, ["t_staging_0"]):
+            raise ValueError()
+    assert pool.conn.queries == [LOCK_STAGING_QUERY, "SELECT pg_advisory_unlock_all()"]
+    assert pool.returned == [(pool.conn, False)]
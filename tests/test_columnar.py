@@ -0,0 +1,52 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from columnar import ColumnarExporter, arrow_type
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+class FakeTable:
+    name = "t"
+
+    def __init__(self, columns, types, rows):
+        self.columns = columns
+        self.columns_types = types
+        self.rows = rows
+
+    def iter_data(self, itersize):
+        yield self.rows
+
+
+def test_catalog_types_map_to_arrow_types():
+    assert arrow_type("bigint") == pa.int64()
+    assert arrow_type("smallint") == pa.int16()
+    assert arrow_type("boolean") == pa.bool_()
+    assert arrow_type("date") == pa.date32()
+    assert arrow_type("numeric(10,2)") == pa.decimal128(10, 2)
+    assert arrow_type("numeric") == pa.string()
+    assert arrow_type("timestamp(3) with time zone") == pa.timestamp("us", tz="UTC")
+    assert arrow_type("character varying(20)") == pa.string()
+
+
+def test_export_round_trips_catalog_types(tmp_path):
+    columns = ["id", "flag", "day", "price", "amount", "at", "key", "doc"]
+    types = ["bigint", "boolean", "date", "numeric(10,2)", "numeric", "timestamp with time zone", "uuid", "jsonb"]
+    at = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone(timedelta(hours=3)))
+    rows = [
+        (2 ** 40, True, date(2024, 1, 2), Decimal("1.50"), Decimal("1e100"), at,
+         "a0eebc99-9c0b-4ef8-bb6d-6bb9bd380a11", {"a": 1}),
+        (None, None, None, None, None, None, None, None),
+    ]
+    path = str(tmp_path / "t.parquet")
+    assert ColumnarExporter(FakeTable(columns, types, rows)).export(path) == 2
+    table = pq.read_table(path)
+    first = table.to_pylist()[0]
+    assert first["id"] == 2 ** 40 and first["flag"] is True and first["day"] == date(2024, 1, 2)
+    assert first["price"] == Decimal("1.50") and first["amount"] == "1E+100"
+    assert first["at"] == datetime(2024, 1, 2, 0, 4, 5, tzinfo=timezone.utc)
+    assert first["doc"] == '{"a": 1}'
+    assert all(value is None for value in table.to_pylist()[1].values())
@@ -0,0 +1,65 @@
+import struct
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from fakes import render
+from postgres.copy_loader import BINARY_HEADER, BINARY_TRAILER, CopyLoader, binary_type
+
+
+def binary_fields(loader: CopyLoader, row: list) -> list:
+    data = loader.encode_binary([row]).getvalue()
+    assert data.startswith(BINARY_HEADER) and data.endswith(BINARY_TRAILER)
+    data = data[len(BINARY_HEADER):-len(BINARY_TRAILER)]
+    count, = struct.unpack("!h", data[:2])
+    fields, position = [], 2
+    for _ in range(count):
+        length, = struct.unpack("!i", data[position:position + 4])
+        position += 4
+        if length < 0:
+            fields.append(None)
+            continue
+        fields.append(data[position:position + length])
+        position += length
+    return fields
+
+
+def test_binary_type_ignores_modifiers():
+    assert binary_type("character varying(20)") == "text"
+    assert binary_type("timestamp(3) without time zone") == "timestamp"
+    assert binary_type("numeric(10,2)") is None
+
+
+def test_binary_integer_and_bool_layouts():
+    loader = CopyLoader("t", ["a", "b", "c", "d", "e"], ["int", "bigint", "smallint", "boolean", "real"],
+                        copy_format="binary")
+    assert loader.copy_format == "binary"
+    fields = binary_fields(loader, [1, 2 ** 40, -3, True, None])
+    assert fields == [struct.pack("!i", 1), struct.pack("!q", 2 ** 40), struct.pack("!h", -3), b"\x01", None]
+
+
+def test_binary_timestamp_normalises_aware_values_to_utc():
+    loader = CopyLoader("t", ["at"], ["timestamp with time zone"], copy_format="binary")
+    aware = datetime(2000, 1, 1, 3, tzinfo=timezone(timedelta(hours=3)))
+    assert binary_fields(loader, [aware]) == [struct.pack("!q", 0)]
+    assert binary_fields(loader, [datetime(2000, 1, 2)]) == [struct.pack("!q", 86_400_000_000)]
+
+
+def test_binary_date():
+    loader = CopyLoader("t", ["d"], ["date"], copy_format="binary")
+    assert binary_fields(loader, [date(1999, 12, 31)]) == [struct.pack("!i", -1)]
+
+
+@pytest.mark.parametrize("column_type", ["numeric", "numeric(10,2)", "uuid", "jsonb"])
+def test_types_without_binary_encoder_fall_back_to_text(column_type):
+    loader = CopyLoader("t", ["id", "value"], ["int", column_type], copy_format="binary")
+    assert loader.copy_format == "text"
+    assert render(loader.query).endswith("FROM STDIN WITH (FORMAT text)")
+    assert loader.encode([[1, Decimal("1.50")]]).getvalue() == b"1\t1.50\n"
+
+
+def test_text_format_escapes_and_nulls():
+    loader = CopyLoader("t", ["a", "b"], ["text", "timestamp"])
+    assert loader.encode([["x\ty\\", None], ["z", datetime(2024, 1, 2, 3, 4, 5)]]).getvalue() == \
+        b"x\\ty\\\\\t\\N\nz\t2024-01-02 03:04:05\n"
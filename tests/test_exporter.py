@@ -0,0 +1,19 @@
+from exporter import TableExporter
+from fakes import FakeDatabase, render
+from main import Table
+
+
+def copy_query_for(kind: str, tmp_path) -> str:
+    database = FakeDatabase([("t", "n", "integer", 1, False, False, kind, None, "p")], [])
+    TableExporter(Table(database, "t"), export_format="csv").export(str(tmp_path / "t.csv"))
+    query, _ = database.cursors[-1].executed[-1]
+    return render(query)
+
+
+def test_partitioned_table_is_copied_through_a_query(tmp_path):
+    assert copy_query_for("p", tmp_path) == 'COPY (SELECT * FROM "t") TO STDOUT WITH (FORMAT csv, HEADER true)'
+    assert copy_query_for("v", tmp_path).startswith('COPY (SELECT * FROM "t")')
+
+
+def test_plain_table_is_copied_directly(tmp_path):
+    assert copy_query_for("r", tmp_path) == 'COPY "t" TO STDOUT WITH (FORMAT csv, HEADER true)'
@@ -0,0 +1,128 @@
+from datetime import datetime
+
+import pytest
+
+from importer import (ImportPipeline, ParallelImportPipeline, RowParseError, compile_converters, count_lines,
+                      iter_lines, parse_range, parse_rows, parse_timestamp, split_ranges, types_parse)
+
+TYPES = ["int", "float", "text", "timestamp"]
+
+
+def write(tmp_path, data: str) -> str:
+    path = tmp_path / "data.txt"
+    path.write_bytes(data.encode("utf-8"))
+    return str(path)
+
+
+def test_parse_rows_converts_every_column():
+    rows = parse_rows(TYPES, [["1", "2.5", "x", "2024-01-02 03:04:05.123456"]])
+    assert rows == [[1, 2.5, "x", datetime(2024, 1, 2, 3, 4, 5, 123456)]]
+
+
+def test_parse_rows_accepts_type_aliases():
+    assert parse_rows(["integer", "double precision", "varchar"], [["7", "1", "a"]]) == [[7, 1.0, "a"]]
+
+
+def test_types_parse_single_row():
+    assert types_parse(["int", "text"], ["3", "b"]) == [3, "b"]
+
+
+def test_parse_timestamp_accepts_only_the_fixed_layout():
+    assert parse_timestamp("2024-01-02 03:04:05") == datetime(2024, 1, 2, 3, 4, 5)
+    assert parse_timestamp("2024-01-02 03:04:05.5") == datetime(2024, 1, 2, 3, 4, 5, 500000)
+    assert parse_timestamp("2024-01-02 03:04:05.000123") == datetime(2024, 1, 2, 3, 4, 5, 123)
+    for value in ("02.01.2024", "2024-01-02", "2024-01-02T03:04:05", "2024-01-02 03:04:05+00:00",
+                  "2024-01-02 03:04:05.", "2024-01-02 03:04:05.1234567", "2024-13-02 03:04:05", "2024-01-02 +3:04:05"):
+        with pytest.raises(ValueError):
+            parse_timestamp(value)
+
+
+def test_compile_converters_is_cached():
+    types = ("int", "text")
+    assert compile_converters(types) is compile_converters(types)
+    assert compile_converters(types) == (int, str)
+    hits = compile_converters.cache_info().hits
+    parse_rows(list(types), [["1", "a"]])
+    assert compile_converters.cache_info().hits == hits + 1
+
+
+def test_parse_rows_locates_bad_value():
+    with pytest.raises(RowParseError) as error:
+        parse_rows(["int", "int"], [["1", "2"], ["3", "x"]], first_row=10)
+    assert (error.value.row, error.value.column, error.value.value, error.value.column_type) == (11, 2, "x", "int")
+    assert str(error.value) == "Row 11, column 2: cannot convert 'x' to int"
+
+
+def test_parse_rows_reports_field_count():
+    with pytest.raises(RowParseError) as error:
+        parse_rows(["int", "int"], [["1", "2"], ["3"]])
+    assert error.value.column_type is None
+    assert str(error.value) == "Row 2: expected 2 fields, got 1"
+
+
+def test_row_parse_error_shifted():
+    error = RowParseError(2, 1, "x", "int").shifted(100)
+    assert (error.row, error.column, error.value, error.column_type) == (102, 1, "x", "int")
+
+
+def test_iter_lines_offsets_and_empty_lines(tmp_path):
+    path = write(tmp_path, "1\ta\r\n\n2\tb")
+    assert list(iter_lines(path)) == [(["1", "a"], 5), (["2", "b"], 9)]
+    assert list(iter_lines(path, 5)) == [(["2", "b"], 9)]
+
+
+def test_count_lines_skips_blank_lines_like_iter_lines(tmp_path):
+    path = write(tmp_path, "1\ta\n\n2\tb\r\n\r\n3\tc\n\n")
+    assert count_lines(path) == len(list(iter_lines(path))) == 3
+    assert count_lines(write(tmp_path, "1\ta\n\n2\tb")) == 2
+
+
+def test_split_ranges_end_on_line_boundaries(tmp_path):
+    data = "".join("{}\tvalue\n".format(i) for i in range(100))
+    path = write(tmp_path, data)
+    ranges = split_ranges(path, range_size=64)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+    assert all(data[end - 1] == "\n" for _, end in ranges)
+
+
+def test_parse_range_splits_like_iter_lines(tmp_path):
+    data = "a\x0cb\t1\nc\u2028d\t2\r\n"
+    path = write(tmp_path, data)
+    assert [fields for fields, _ in iter_lines(path)] == [["a\x0cb", "1"], ["c\u2028d", "2"]]
+    assert parse_range(path, 0, len(data.encode("utf-8")), ["text", "int"]) == [["a\x0cb", 1], ["c\u2028d", 2]]
+
+
+def test_chunks_resume_from_offset(tmp_path):
+    path = write(tmp_path, "".join("{}\tv{}\n".format(i, i) for i in range(10)))
+    pipeline = ImportPipeline(path, ["int", "text"], chunk_size=4)
+    chunks = list(pipeline.chunks())
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert pipeline.bytes_read == pipeline.total_bytes and pipeline.rows_count == 10
+
+    offset = next(offset for fields, offset in iter_lines(path) if fields[0] == "3")
+    resumed = [row for chunk in pipeline.chunks(offset, 4) for row in chunk]
+    assert resumed == [[i, "v{}".format(i)] for i in range(4, 10)]
+    assert pipeline.rows_count == 10
+
+
+def test_chunks_error_row_counts_from_start(tmp_path):
+    path = write(tmp_path, "1\n2\nx\n")
+    with pytest.raises(RowParseError) as error:
+        list(ImportPipeline(path, ["int"], chunk_size=2).chunks())
+    assert error.value.row == 3
+
+
+def test_parallel_chunks_match_serial(tmp_path):
+    path = write(tmp_path, "".join("{}\t{}.5\n".format(i, i) for i in range(200)))
+    serial = [row for chunk in ImportPipeline(path, ["int", "float"]).chunks() for row in chunk]
+    parallel = [row for chunk in ParallelImportPipeline(path, ["int", "float"], pool_size=2, range_size=256).chunks()
+                for row in chunk]
+    assert parallel == serial
+
+
+def test_parallel_chunks_shift_error_rows(tmp_path):
+    path = write(tmp_path, "".join("{}\n".format(i) for i in range(50)) + "x\n")
+    with pytest.raises(RowParseError) as error:
+        list(ParallelImportPipeline(path, ["int"], pool_size=2, range_size=32).chunks())
+    assert error.value.row == 51
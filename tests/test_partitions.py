@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+from fakes import FakeDatabase, render
+from main import Table
+from postgres.partitions import RangePartitioning
+from postgres.query_builder import MAX_IDENTIFIER_BYTES
+
+
+def test_bounds_and_names():
+    partitioning = RangePartitioning("events", "at", "timestamp", "month")
+    bounds = partitioning.bounds(datetime(2024, 12, 15, 8))
+    assert bounds == (datetime(2024, 12, 1), datetime(2025, 1, 1))
+    assert partitioning.partition_name(bounds) == "events_p20241201"
+    assert partitioning.partition_name(None) == "events_default"
+    assert RangePartitioning("t", "n", "int", 10).partition_name((-20, -10)) == "t_pm20"
+
+
+def test_long_partition_names_stay_distinct():
+    partitioning = RangePartitioning("t" * 60, "at", "timestamp", "day")
+    names = {partitioning.partition_name(partitioning.bounds(datetime(2024, 1, day))) for day in (1, 2)}
+    names.add(partitioning.partition_name(None))
+    assert len(names) == 3
+    assert all(len(name.encode("utf-8")) <= MAX_IDENTIFIER_BYTES for name in names)
+
+
+def test_comment_round_trip():
+    partitioning = RangePartitioning("t", "n", "integer", 100)
+    restored = RangePartitioning.from_comment("t", ["n"], ["int"], partitioning.comment())
+    assert (restored.column, restored.column_type, restored.interval) == ("n", "int", 100)
+    assert RangePartitioning.from_comment("t", ["n"], ["int"], "free text") is None
+
+
+def test_only_int_and_timestamp_columns():
+    with pytest.raises(Exception, match="Only timestamp and int"):
+        RangePartitioning("t", "name", "text", 1)
+
+
+def test_partitioned_table_without_key_pages_partition_by_partition():
+    catalog_rows = [("t", "n", "integer", 1, False, False, "p", None, "p")]
+    heaps = [(16401, "t_p1", 1, 1), (16402, "t_p2", 1, 2)]
+    pages = [[(1, 16401, "(0,1)")], [(2, 16402, "(0,1)")], [(3, 16402, "(0,2)")]]
+    database = FakeDatabase(catalog_rows, pages, heaps)
+    table = Table(database, "t")
+
+    rows, cursor = table.get_page(limit=2)
+    assert rows == [(1,), (2,)]
+    assert cursor == (16402, "(0,1)")
+    assert [call[0] for call in database.prepared.calls] == ["page_range_t_p1", "page_range_t_p2"]
+    assert '"t_p1"' in render(database.prepared.calls[0][1])
+
+    rows, cursor = table.get_page(cursor, limit=2)
+    assert rows == [(3,)] and cursor is None
+    purpose, _, params = database.prepared.calls[2]
+    assert purpose == "page_range_t_p2"
+    assert params[:2] == ["(0,1)", "(2,0)"]
+    assert table.seek(0.75) == (16402, "(0,1)")
+
+
+def test_plain_table_keeps_single_key_cursor():
+    catalog_rows = [("t", "id", "integer", 1, True, True, "r", None, "p")]
+    database = FakeDatabase(catalog_rows, [[(1,), (2,)], [(3,)]])
+    table = Table(database, "t")
+    rows, cursor = table.get_page(limit=2)
+    assert cursor == 2
+    table.get_page(cursor, limit=2)
+    assert database.prepared.calls[1][2][:1] == [2]
+
+
+def test_keyless_table_reads_growing_block_windows():
+    catalog_rows = [("t", "n", "integer", 1, False, False, "r", None, "p")]
+    database = FakeDatabase(catalog_rows, [[], [(1, "(9,1)"), (2, "(9,2)")]], [(16400, "t", 100, 0)])
+    table = Table(database, "t")
+    rows, cursor = table.get_page(limit=2)
+    assert rows == [(1,), (2,)] and cursor == "(9,2)"
+    assert [call[2][:2] for call in database.prepared.calls] == [["(0,0)", "(8,0)"], ["(8,0)", "(24,0)"]]
+    assert "ORDER BY" in render(database.prepared.calls[0][1])
+    assert table.seek(0.5) == "(50,0)"
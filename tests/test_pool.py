@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from postgres.pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, on_query=None):
+        self.closed = False
+        self.on_query = on_query
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if self.on_query:
+            self.on_query()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSettings:
+    def __init__(self, fail_after: int = None, on_query=None):
+        self.opened = []
+        self.fail_after = fail_after
+        self.on_query = on_query
+
+    def connect(self):
+        if self.fail_after is not None and len(self.opened) == self.fail_after:
+            raise Exception("connection refused")
+        conn = FakeConnection(self.on_query)
+        self.opened.append(conn)
+        return conn
+
+
+def test_failed_init_closes_opened_connections():
+    settings = FakeSettings(fail_after=2)
+    with pytest.raises(Exception, match="connection refused"):
+        ConnectionPool(settings, min_size=3)
+    assert len(settings.opened) == 2
+    assert all(conn.closed for conn in settings.opened)
+
+
+def test_health_check_runs_without_the_pool_lock():
+    pool = None
+    lock_free = []
+
+    def try_lock():
+        acquired = pool._condition.acquire(blocking=False)
+        lock_free.append(acquired)
+        if acquired:
+            pool._condition.release()
+
+    def on_query():
+        # The condition's lock is re-entrant, so probe it from another thread
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join(5)
+
+    settings = FakeSettings(on_query=on_query)
+    pool = ConnectionPool(settings, min_size=1, health_check_interval=0)
+    assert pool.getconn() is settings.opened[0]
+    assert lock_free == [True]
+    assert len(pool) == 1
@@ -0,0 +1,25 @@
+from postgres.prepared import PreparedStatements, to_positional
+from postgres.query_builder import MAX_IDENTIFIER_BYTES, short_identifier
+
+
+def test_to_positional():
+    assert to_positional("SELECT * FROM t WHERE a = %s AND b LIKE '%%x' LIMIT %s") == \
+        "SELECT * FROM t WHERE a = $1 AND b LIKE '%x' LIMIT $2"
+
+
+def test_short_identifier_keeps_short_names():
+    assert short_identifier("t__page_first") == "t__page_first"
+
+
+def test_short_identifier_fits_in_bytes():
+    name = short_identifier("таблица" * 10)
+    assert len(name.encode("utf-8")) <= MAX_IDENTIFIER_BYTES
+    assert name.startswith("таблица")
+
+
+def test_long_table_statement_names_stay_distinct():
+    table_name = "t" * 70
+    first = PreparedStatements.statement_name(table_name, "page_first")
+    after = PreparedStatements.statement_name(table_name, "page_after")
+    assert first != after
+    assert len(first) <= MAX_IDENTIFIER_BYTES and len(after) <= MAX_IDENTIFIER_BYTES
@@ -0,0 +1,172 @@
+import pytest
+
+from fakes import render
+from postgres.query_builder import QueryBuilder, QueryBuilderBase
+
+
+def test_select_all():
+    query, params = QueryBuilder.select_query("t")
+    assert render(query) == 'SELECT * FROM "t"'
+    assert params == []
+
+
+def test_select_columns_and_equality_predicates():
+    query, params = QueryBuilder.select_query("t", ["a", "b"], {"a": 1, "b": "x"})
+    assert render(query) == 'SELECT "a", "b" FROM "t" WHERE "a" = %s AND "b" = %s'
+    assert params == [1, "x"]
+
+
+def test_select_or_operation():
+    query, params = QueryBuilder.select_query("t", select_parameters={"a": 1, "b": 2}, select_operation="OR")
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" = %s OR "b" = %s'
+    assert params == [1, 2]
+
+
+def test_none_compiles_to_is_null_without_parameter():
+    query, params = QueryBuilder.select_query("t", select_parameters={"a": None, "b": 5})
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" IS NULL AND "b" = %s'
+    assert params == [5]
+
+
+def test_statement_shape_is_cached_across_values():
+    first, first_params = QueryBuilder.select_query("t", select_parameters={"a": 1})
+    second, second_params = QueryBuilder.select_query("t", select_parameters={"a": 2})
+    assert first is second
+    assert (first_params, second_params) == ([1], [2])
+    null, _ = QueryBuilder.select_query("t", select_parameters={"a": None})
+    assert null is not first
+
+
+def test_insert_query():
+    query, params = QueryBuilder.insert_query("t", ["a", "b"], [1, "x"])
+    assert render(query) == 'INSERT INTO "t" ("a", "b") VALUES (%s, %s)'
+    assert params == [1, "x"]
+
+
+def test_insert_values_count_must_match():
+    with pytest.raises(Exception, match="Values count"):
+        QueryBuilder.insert_query("t", ["a", "b"], [1])
+
+
+def test_update_query_params_order():
+    query, params = QueryBuilder.update_query("t", ["a"], [10], {"id": 3})
+    assert render(query) == 'UPDATE "t" SET "a" = %s WHERE "id" = %s'
+    assert params == [10, 3]
+
+
+def test_identifiers_are_quoted():
+    query, _ = QueryBuilder.select_query('we"ird', ["col umn"])
+    assert render(query) == 'SELECT "col umn" FROM "we""ird"'
+
+
+def test_create_table_query():
+    definitions = [
+        {"name": "id", "type": "int", "is_unique": True, "null": True},
+        {"name": "value", "type": "text", "is_unique": False, "null": False},
+    ]
+    assert render(QueryBuilder.create_table_query("t", definitions)) == \
+        'CREATE TABLE "t" ("id" int PRIMARY KEY NOT NULL, "value" text)'
+
+
+def test_create_table_rejects_unknown_type():
+    with pytest.raises(Exception, match="Unknown column type"):
+        QueryBuilder.create_table_query("t", [{"name": "a", "type": "money", "is_unique": False, "null": False}])
+
+
+def test_create_database_query():
+    assert render(QueryBuilder.create_database_query("db")) == 'CREATE DATABASE "db"'
+
+
+def test_unknown_query_type():
+    with pytest.raises(Exception, match="Unknown query type"):
+        QueryBuilderBase.create_query("DELETE", table_name="t")
+
+
+@pytest.mark.parametrize("operator", ["=", "<>", "<", "<=", ">", ">=", "LIKE", "ILIKE"])
+def test_comparison_operators(operator):
+    query, params = QueryBuilder.select_query("t", select_parameters=[("a", operator, 1)])
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" {} %s'.format(operator)
+    assert params == [1]
+
+
+def test_tuple_value_in_dict_is_operator_and_value():
+    query, params = QueryBuilder.select_query("t", select_parameters={"a": (">", 5), "b": 1})
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" > %s AND "b" = %s'
+    assert params == [5, 1]
+
+
+def test_in_is_one_array_parameter():
+    query, params = QueryBuilder.select_query("t", select_parameters=[("a", "IN", [1, 2, 3])])
+    other, _ = QueryBuilder.select_query("t", select_parameters=[("a", "IN", [4])])
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" = ANY(%s)'
+    assert params == [[1, 2, 3]]
+    assert query is other
+
+
+def test_not_equal_null():
+    query, params = QueryBuilder.select_query("t", select_parameters=[("a", "<>", None)])
+    assert render(query) == 'SELECT * FROM "t" WHERE "a" IS NOT NULL'
+    assert params == []
+
+
+def test_null_only_with_equality():
+    with pytest.raises(Exception, match="NULL can only be compared"):
+        QueryBuilder.select_query("t", select_parameters=[("a", ">", None)])
+
+
+def test_unknown_operator():
+    with pytest.raises(Exception, match="Unknown comparison operator"):
+        QueryBuilder.select_query("t", select_parameters=[("a", "; DROP", 1)])
+
+
+def test_unknown_select_operation():
+    with pytest.raises(Exception, match="Unknown select operation"):
+        QueryBuilder.select_query("t", select_parameters={"a": 1}, select_operation="XOR")
+
+
+def test_order_and_limit():
+    query, params = QueryBuilder.select_query("t", order_by=["a", "id"], limit=10, offset=20)
+    assert render(query) == 'SELECT * FROM "t" ORDER BY "a", "id" LIMIT %s OFFSET %s'
+    assert params == [10, 20]
+
+
+def test_keyset_page():
+    query, params = QueryBuilder.select_query("t", order_by=["a", "id"], after=(5, 7), limit=10)
+    assert render(query) == 'SELECT * FROM "t" WHERE ("a", "id") > (%s, %s) ORDER BY "a", "id" LIMIT %s'
+    assert params == [5, 7, 10]
+
+
+def test_keyset_descending_orders_every_column():
+    query, _ = QueryBuilder.select_query("t", order_by=["a", "id"], descending=True, after=(5, 7))
+    assert render(query) == 'SELECT * FROM "t" WHERE ("a", "id") < (%s, %s) ORDER BY "a" DESC, "id" DESC'
+
+
+def test_keyset_with_predicates():
+    query, params = QueryBuilder.select_query("t", select_parameters={"a": 1, "b": 2}, select_operation="OR",
+                                              order_by=["id"], after=(9,), limit=5)
+    assert render(query) == \
+        'SELECT * FROM "t" WHERE ("a" = %s OR "b" = %s) AND ("id") > (%s) ORDER BY "id" LIMIT %s'
+    assert params == [1, 2, 9, 5]
+
+
+def test_keyset_needs_order():
+    with pytest.raises(Exception, match="Keyset pagination needs order_by"):
+        QueryBuilder.select_query("t", after=(1,))
+
+
+def test_create_index_query():
+    assert render(QueryBuilder.create_index_query("t", ["a", "b"])) == \
+        'CREATE INDEX IF NOT EXISTS "t_a_b_btree_idx" ON "t" USING btree ("a", "b")'
+
+
+def test_create_index_query_shortens_long_names():
+    first = render(QueryBuilder.create_index_query("t" * 60, ["a"], "brin"))
+    second = render(QueryBuilder.create_index_query("t" * 60, ["b"], "brin"))
+    assert first.split()[5] != second.split()[5]
+
+
+def test_create_index_query_validation():
+    with pytest.raises(Exception, match="Unknown index method"):
+        QueryBuilder.create_index_query("t", ["a"], "gist")
+    with pytest.raises(Exception, match="single column"):
+        QueryBuilder.create_index_query("t", ["a", "b"], "hash")
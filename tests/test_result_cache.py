@@ -0,0 +1,86 @@
+from fakes import FakeDatabase
+from main import Table
+from postgres.result_cache import MISS, ResultCache
+
+CATALOG_ROWS = [("t", "id", "integer", 1, True, True, "r", None, "p")]
+
+
+def test_get_put_and_invalidate():
+    cache = ResultCache()
+    cache.put("t", ("query", 1), "rows")
+    cache.put("u", ("query", 1), "other")
+    assert cache.get("t", ("query", 1)) == "rows"
+    cache.invalidate("t")
+    assert cache.get("t", ("query", 1)) is MISS
+    assert cache.get("u", ("query", 1)) == "other"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_list_keys_are_frozen():
+    cache = ResultCache()
+    cache.put("t", ("query", [1, [2, 3]]), "rows")
+    assert cache.get("t", ("query", (1, (2, 3)))) == "rows"
+
+
+def test_expired_entries_are_dropped():
+    cache = ResultCache()
+    cache.put("t", "key", "rows", ttl=-1)
+    assert cache.get("t", "key") is MISS
+    assert cache.size == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_bytes=250)
+    cache.put("t", 1, "a" * 60)
+    cache.put("t", 2, "b" * 60)
+    cache.get("t", 1)
+    cache.put("t", 3, "c" * 60)
+    assert cache.get("t", 2) is MISS
+    assert cache.get("t", 1) == "a" * 60
+    assert cache.size <= cache.max_bytes
+
+
+def test_put_after_invalidate_is_skipped():
+    cache = ResultCache()
+    generation = cache.generation("t")
+    cache.invalidate("t")
+    cache.put("t", "key", "stale", generation=generation)
+    assert cache.get("t", "key") is MISS
+    cache.put("t", "key", "fresh", generation=cache.generation("t"))
+    assert cache.get("t", "key") == "fresh"
+
+
+def test_put_after_clear_is_skipped():
+    cache = ResultCache()
+    generation = cache.generation("t")
+    cache.clear()
+    cache.put("t", "key", "stale", generation=generation)
+    assert cache.get("t", "key") is MISS
+
+
+def test_query_returns_copies_of_cached_rows():
+    database = FakeDatabase(CATALOG_ROWS, [[(1,), (2,)]])
+    table = Table(database, "t")
+    rows, _ = table.query(limit=2, purpose="page_first")
+    rows.append(("mutated",))
+    cached, _ = table.query(limit=2, purpose="page_first")
+    assert cached == [(1,), (2,)]
+    cached.clear()
+    assert table.query(limit=2, purpose="page_first")[0] == [(1,), (2,)]
+    assert len(database.prepared.calls) == 1
+
+
+def test_query_started_before_invalidate_is_not_cached():
+    database = FakeDatabase(CATALOG_ROWS, [[(1,)], [(1,), (2,)]])
+    table = Table(database, "t")
+    execute = database.prepared.execute
+
+    def execute_then_write(*args, **kwargs):
+        execute(*args, **kwargs)
+        # Another thread writes to the table while this read is in flight
+        if len(database.prepared.calls) == 1:
+            table.invalidate_cache()
+
+    database.prepared.execute = execute_then_write
+    assert table.query(limit=2, purpose="page_first")[0] == [(1,)]
+    assert table.query(limit=2, purpose="page_first")[0] == [(1,), (2,)]
@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from tasks import TaskCancelled, TaskExecutor, bind, current_task
+
+
+class FakeWindow:
+    # Polling is driven by the test instead of the Tk event loop
+    def after(self, delay, callback):
+        pass
+
+
+@pytest.fixture
+def executor():
+    executor = TaskExecutor(FakeWindow())
+    yield executor
+    executor.shutdown()
+
+
+def run_posted(executor: TaskExecutor, count: int = 1):
+    # Done callbacks may be posted just after future.result() returns
+    for _ in range(count):
+        callback, args = executor._events.get(timeout=5)
+        callback(*args)
+
+
+def test_done_callback_gets_result(executor):
+    done = []
+    task = executor.submit(lambda task, value: value * 2, 21, on_done=done.append)
+    task.future.result()
+    run_posted(executor)
+    assert done == [42]
+
+
+def test_worker_sees_its_task(executor):
+    task = executor.submit(lambda task: current_task() is task)
+    assert task.future.result()
+    assert current_task() is None
+
+
+def test_bind_carries_task_into_other_threads(executor):
+    def work(task):
+        seen = []
+        thread = threading.Thread(target=bind(lambda: seen.append(current_task())))
+        thread.start()
+        thread.join()
+        return seen[0]
+
+    task = executor.submit(work)
+    assert task.future.result() is task
+
+
+def test_cancel_runs_registered_callbacks_and_skips_removed_ones(executor):
+    started = threading.Event()
+    release = threading.Event()
+    interrupted = []
+
+    def work(task):
+        task.on_cancel(lambda: interrupted.append("kept"))
+        removed = lambda: interrupted.append("removed")
+        task.on_cancel(removed)
+        task.remove_cancel(removed)
+        started.set()
+        release.wait(5)
+        task.check()
+
+    cancelled = []
+    task = executor.submit(work, on_error=cancelled.append, on_cancelled=lambda: cancelled.append("cancelled"))
+    started.wait(5)
+    task.cancel()
+    assert interrupted == ["kept"]
+    assert executor._events.empty()
+    release.set()
+    with pytest.raises(TaskCancelled):
+        task.future.result()
+    run_posted(executor)
+    assert cancelled == ["cancelled"]
+
+
+def test_error_after_cancel_counts_as_cancelled(executor):
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(task):
+        started.set()
+        release.wait(5)
+        raise RuntimeError("canceling statement due to user request")
+
+    errors = []
+    task = executor.submit(work, on_error=errors.append, on_cancelled=lambda: errors.append("cancelled"))
+    started.wait(5)
+    task.cancel()
+    release.set()
+    with pytest.raises(RuntimeError):
+        task.future.result()
+    run_posted(executor)
+    assert errors == ["cancelled"]
@@ -0,0 +1,51 @@
+from interface.elements.virtual_tree import PagedRows
+
+ROWS = list(range(1000))
+
+
+def fetch_from(calls):
+    def fetch_page(after, limit):
+        calls.append(after)
+        start = 0 if after is None else after + 1
+        rows = ROWS[start:start + limit]
+        return rows, rows[-1] if rows else None
+    return fetch_page
+
+
+def test_near_pages_are_read_one_after_another():
+    calls = []
+    rows = PagedRows(fetch_from(calls), page_size=10)
+    assert rows.get_rows(25, 10) == list(range(25, 35))
+    assert calls == [None, 9, 19, 29]
+
+
+def test_far_jump_seeks_an_estimated_key():
+    calls, seeks = [], []
+
+    def seek(fraction):
+        seeks.append(fraction)
+        return int(fraction * len(ROWS)) - 1
+
+    rows = PagedRows(fetch_from(calls), page_size=10, seek=seek)
+    rows.rows_count = len(ROWS)
+    assert rows.get_rows(500, 10) == list(range(500, 510))
+    assert seeks == [0.5] and calls == [499]
+    assert rows.get_rows(510, 10) == list(range(510, 520))
+    assert calls == [499, 509]
+
+
+def test_jump_without_estimate_walks_from_the_nearest_page():
+    calls = []
+    rows = PagedRows(fetch_from(calls), page_size=10, seek=lambda fraction: None)
+    rows.rows_count = len(ROWS)
+    assert rows.get_rows(995, 10) == list(range(995, 1000))
+    assert len(calls) == 101 and rows.exhausted_at == 100
+
+
+def test_cached_only_never_fetches():
+    calls = []
+    rows = PagedRows(fetch_from(calls), page_size=10)
+    assert rows.get_rows(5, 10, cached_only=True) is None and calls == []
+    rows.get_rows(5, 10)
+    assert rows.get_rows(5, 10, cached_only=True) == list(range(5, 15))
+    assert len(calls) == 2
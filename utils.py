@@ -1,6 +1,42 @@
 import matplotlib.pyplot as plt
-from numpy import exp, array
 import numpy as np
 
 
+def build_chart(x_values: np.ndarray,
+                y_values: np.ndarray,
+                x_label: str,
+                y_label: str,
+                title: str,
+                y_errors: list = None):
+    # y_errors is either one list of symmetric errors or [lower, upper] lists; arrays are used without a copy
+    values_x = np.asarray(x_values)
+    values_y = np.asarray(y_values)
+    if len(values_x) != len(values_y) or not len(values_x):
+        return
 
+    for x in values_x:
+        plt.axvline(x=x)
+
+    if y_errors is not None:
+        plt.errorbar(values_x, values_y, yerr=y_errors, fmt="bo", capsize=4)
+    else:
+        plt.plot(values_x, values_y, "bo")
+
+    p = np.polyfit(values_x, values_y, 1)
+    f = np.poly1d(p)
+    plt.plot(values_x, f(values_x), 'b--', label='Approximation')
+
+    y_top = values_y + (np.asarray(y_errors).reshape(-1, len(values_y))[-1] if y_errors is not None else 0)
+    plt.ylim([0, max(values_y[-1] + values_y[0], y_top.max())])
+    plt.xlim([0, values_x[-1] + values_x[0]])
+
+    for xy in zip(values_x, values_y):
+        _xy = (xy[0], xy[1] - (values_y[0] / 2))
+        plt.annotate('(%.4f)' % xy[1], xy=_xy)
+
+    plt.xlabel(x_label)
+    plt.ylabel(y_label)
+
+    plt.title(title)
+    plt.grid()
+    plt.show()